@@ -0,0 +1,177 @@
+import os
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, List, TYPE_CHECKING
+from playwright.async_api import async_playwright, Playwright, Browser, BrowserContext, Page
+
+if TYPE_CHECKING:
+    from app.routing import RequestFilter
+
+DEFAULT_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+DEFAULT_CONTEXT_OPTIONS = {
+    "locale": "pt-BR",
+    "timezone_id": "America/Sao_Paulo",
+    "user_agent": DEFAULT_USER_AGENT,
+}
+
+
+class _ContextSlot:
+    """A browser context plus the number of navigations it has served."""
+
+    def __init__(self):
+        self.context: Optional[BrowserContext] = None
+        self.navigations = 0
+
+
+class BrowserPool:
+    """
+    Long-lived Chromium instance shared by every scraper in the process.
+    Pages are borrowed from a fixed number of context slots, so at most `size`
+    pages are open at once. A context is recycled after `max_navigations`
+    navigations and the browser is relaunched if it stops responding.
+    """
+
+    def __init__(
+        self,
+        size: Optional[int] = None,
+        max_navigations: Optional[int] = None,
+        headless: bool = True,
+        context_options: Optional[Dict[str, Any]] = None,
+    ):
+        self.size = size or int(os.getenv("BROWSER_POOL_SIZE", "4"))
+        self.max_navigations = max_navigations or int(os.getenv("BROWSER_POOL_MAX_NAVIGATIONS", "50"))
+        self.headless = headless
+        self.context_options = context_options or DEFAULT_CONTEXT_OPTIONS
+
+        self._playwright: Optional[Playwright] = None
+        self._browser: Optional[Browser] = None
+        self._slots: Optional[asyncio.Queue] = None
+        self._all_slots: List[_ContextSlot] = []
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_running(self) -> bool:
+        return self._browser is not None
+
+    async def start(self):
+        """Launches the browser (no-op if already running)."""
+        async with self._lock:
+            if self._browser is not None:
+                return
+            self._playwright = await async_playwright().start()
+            await self._launch()
+            self._slots = asyncio.Queue()
+            self._all_slots = [_ContextSlot() for _ in range(self.size)]
+            for slot in self._all_slots:
+                self._slots.put_nowait(slot)
+
+    async def _launch(self):
+        print(f"🌐 Launching shared browser (pool size: {self.size})...")
+        self._browser = await self._playwright.chromium.launch(headless=self.headless)
+
+    async def _ensure_healthy(self):
+        """Relaunches the browser if it crashed or was disconnected."""
+        if self._browser is not None and self._browser.is_connected():
+            return
+        async with self._lock:
+            if self._browser is not None and self._browser.is_connected():
+                return
+            print("⚠️ Shared browser is not connected, relaunching...")
+            for slot in self._all_slots:
+                slot.context = None
+                slot.navigations = 0
+            await self._launch()
+
+    async def _prepare_slot(self, slot: _ContextSlot) -> BrowserContext:
+        if slot.context is not None and slot.navigations >= self.max_navigations:
+            try:
+                await slot.context.close()
+            except Exception:
+                pass
+            slot.context = None
+
+        if slot.context is None:
+            slot.context = await self._browser.new_context(**self.context_options)
+            slot.navigations = 0
+        return slot.context
+
+    @asynccontextmanager
+    async def page(self, request_filter: Optional["RequestFilter"] = None):
+        """
+        Borrows a fresh page from the pool and closes it on exit.
+        If a RequestFilter is given, its routing is installed on the page.
+        Usage: `async with pool.page() as page: ...`
+        """
+        if not self.is_running:
+            await self.start()
+
+        slot: _ContextSlot = await self._slots.get()
+        page: Optional[Page] = None
+        try:
+            await self._ensure_healthy()
+            try:
+                context = await self._prepare_slot(slot)
+                page = await context.new_page()
+            except Exception:
+                # Context is unusable (e.g. closed under us); start a new one
+                slot.context = None
+                context = await self._prepare_slot(slot)
+                page = await context.new_page()
+
+            def _count_navigation(frame):
+                if frame == page.main_frame:
+                    slot.navigations += 1
+
+            page.on("framenavigated", _count_navigation)
+            if request_filter is not None:
+                await request_filter.attach(page)
+            yield page
+        finally:
+            if page is not None:
+                try:
+                    await page.close()
+                except Exception:
+                    pass
+            self._slots.put_nowait(slot)
+
+    async def close(self):
+        """Closes every context, the browser and the Playwright driver."""
+        async with self._lock:
+            for slot in self._all_slots:
+                if slot.context is not None:
+                    try:
+                        await slot.context.close()
+                    except Exception:
+                        pass
+                    slot.context = None
+            if self._browser is not None:
+                try:
+                    await self._browser.close()
+                except Exception:
+                    pass
+                self._browser = None
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+            self._slots = None
+            self._all_slots = []
+
+
+_pool: Optional[BrowserPool] = None
+
+
+def get_browser_pool(headless: bool = True) -> BrowserPool:
+    """Returns the process-wide browser pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        _pool = BrowserPool(headless=headless)
+    return _pool
+
+
+async def close_browser_pool():
+    """Shuts down the process-wide browser pool if it was started."""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
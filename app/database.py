@@ -1,48 +1,140 @@
+"""
+Database engines and sessions, created on first use.
+
+Importing this module has no side effects (no env reading, file checks or
+connections), so CLI runs that never touch the database don't pay for it.
+`engine`, `async_engine`, `SessionLocal` and `AsyncSessionLocal` are still
+importable by name; they are built the first time they are accessed.
+sqlalchemy.ext.asyncio (and greenlet) is only loaded by the async getters,
+so sync-only callers (scripts, migrations) don't need it installed.
+"""
 import os
+import ssl
+from typing import Optional, Dict, TYPE_CHECKING
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, declarative_base
-from dotenv import load_dotenv
-
-load_dotenv()
-
-DB_HOST = os.getenv("DB_HOST")
-DB_NAME = os.getenv("DB_NAME", "postgres")
-DB_USER = os.getenv("DB_USER", "postgres")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_PORT = os.getenv("DB_PORT", "5432")
-
-# SSL Configuration
-# RDS often requires SSL. We check for the cert file.
-ssl_args = {}
-cert_path = os.path.join(os.getcwd(), "global-bundle.pem")
-if os.path.exists(cert_path):
-    print(f"🔒 SSL Certificate found at {cert_path}")
-    ssl_args = {
-        "sslmode": "verify-full",
-        "sslrootcert": cert_path
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+# Base class for models
+Base = declarative_base()
+
+_engine: Optional[Engine] = None
+_async_engine: Optional["AsyncEngine"] = None
+_session_factory: Optional[sessionmaker] = None
+_async_session_factory: Optional["async_sessionmaker"] = None
+
+
+def _settings() -> Dict:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    # SSL Configuration
+    # RDS often requires SSL. We check for the cert file.
+    ssl_args = {}
+    async_ssl_args = {}
+    cert_path = os.path.join(os.getcwd(), "global-bundle.pem")
+    if os.path.exists(cert_path):
+        print(f"🔒 SSL Certificate found at {cert_path}")
+        ssl_args = {
+            "sslmode": "verify-full",
+            "sslrootcert": cert_path
+        }
+        # asyncpg takes an SSLContext instead of libpq options (verifies the hostname too)
+        async_ssl_args = {"ssl": ssl.create_default_context(cafile=cert_path)}
+    else:
+        print("⚠️  SSL Certificate not found. Connection might fail if RDS requires SSL.")
+
+    # Construct connection string
+    credentials = "{user}:{password}@{host}:{port}/{name}".format(
+        user=os.getenv("DB_USER", "postgres"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT", "5432"),
+        name=os.getenv("DB_NAME", "postgres"),
+    )
+    return {
+        "url": f"postgresql://{credentials}",
+        "async_url": f"postgresql+asyncpg://{credentials}",
+        "ssl_args": ssl_args,
+        "async_ssl_args": async_ssl_args,
+        # Connection pool, shared by the sync and async engines
+        "pool_args": {
+            "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+            "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "1") != "0",
+            "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")), # RDS/NAT drop idle connections
+        },
     }
-else:
-    print("⚠️  SSL Certificate not found. Connection might fail if RDS requires SSL.")
 
-# Construct connection string
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-# Create engine with SSL args
-engine = create_engine(
-    DATABASE_URL, 
-    echo=False,
-    connect_args=ssl_args
-)
+def get_engine() -> Engine:
+    global _engine
+    if _engine is None:
+        settings = _settings()
+        # Create engine with SSL args
+        _engine = create_engine(
+            settings["url"],
+            echo=False,
+            connect_args=settings["ssl_args"],
+            **settings["pool_args"]
+        )
+    return _engine
 
-# Session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# Base class for models
-Base = declarative_base()
+def get_async_engine() -> "AsyncEngine":
+    """Async engine for code running on the event loop (pipeline persistence)."""
+    global _async_engine
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        settings = _settings()
+        _async_engine = create_async_engine(
+            settings["async_url"],
+            echo=False,
+            connect_args=settings["async_ssl_args"],
+            **settings["pool_args"]
+        )
+    return _async_engine
+
+
+def get_session_factory() -> sessionmaker:
+    global _session_factory
+    if _session_factory is None:
+        _session_factory = sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+    return _session_factory
+
+
+def get_async_session_factory() -> "async_sessionmaker":
+    global _async_session_factory
+    if _async_session_factory is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        _async_session_factory = async_sessionmaker(bind=get_async_engine(), autoflush=False, expire_on_commit=False)
+    return _async_session_factory
+
+
+_LAZY = {
+    "engine": get_engine,
+    "async_engine": get_async_engine,
+    "SessionLocal": get_session_factory,
+    "AsyncSessionLocal": get_async_session_factory,
+}
+
+
+def __getattr__(name: str):
+    # Module-level lazy attributes (PEP 562)
+    if name in _LAZY:
+        return _LAZY[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 def get_db():
     """Dependency for getting DB session"""
-    db = SessionLocal()
+    db = get_session_factory()()
     try:
         yield db
     finally:
@@ -0,0 +1,130 @@
+import re
+import csv
+import glob
+import unicodedata
+from typing import Optional, Set, Iterable
+from app.models import Lead
+
+# Maps place URLs embed the feature id as "!1s0x<hex>:0x<hex>"
+PLACE_ID_RE = re.compile(r"!1s(0x[0-9a-fA-F]+:0x[0-9a-fA-F]+)")
+# ... and the coordinates as "!3d<lat>!4d<lng>"
+COORDS_RE = re.compile(r"!3d(-?\d+(?:\.\d+)?)!4d(-?\d+(?:\.\d+)?)")
+
+
+def normalize_name(name: str) -> str:
+    """Lowercases and strips accents/punctuation so 'Padaria São João' == 'padaria sao joao'."""
+    text = unicodedata.normalize("NFKD", name or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^a-z0-9]+", " ", text.lower())
+    return text.strip()
+
+
+def normalize_phone(phone: Optional[str]) -> str:
+    """Digits only, without the +55 country code, so '(11) 3333-4444' == '+55 11 3333 4444'."""
+    digits = re.sub(r"\D", "", phone or "")
+    if digits.startswith("55") and len(digits) >= 12:
+        digits = digits[2:]
+    return digits
+
+
+def contact_key(phone: Optional[str] = None, email: Optional[str] = None) -> str:
+    """Identity of a contact within its company: phone, else e-mail, else the single general contact."""
+    digits = normalize_phone(phone)
+    if digits:
+        return f"tel:{digits}"
+    if email and email.strip():
+        return f"email:{email.strip().lower()}"
+    return "geral"
+
+
+def parse_place_id(source_url: Optional[str]) -> Optional[str]:
+    """Extracts the Maps place id (0x...:0x...) from a place URL."""
+    if not source_url:
+        return None
+    match = PLACE_ID_RE.search(source_url)
+    return match.group(1).lower() if match else None
+
+
+def place_key(name: Optional[str], source_url: Optional[str]) -> Optional[str]:
+    """
+    Stable identity for a place: the Maps place id when present, otherwise
+    normalized name + coordinates (rounded to ~10 m), otherwise the name alone.
+    """
+    place_id = parse_place_id(source_url)
+    if place_id:
+        return f"id:{place_id}"
+
+    norm = normalize_name(name or "")
+    if source_url:
+        match = COORDS_RE.search(source_url)
+        if match and norm:
+            lat, lng = float(match.group(1)), float(match.group(2))
+            return f"geo:{norm}|{lat:.4f}|{lng:.4f}"
+    return f"name:{norm}" if norm else None
+
+
+class LeadIndex:
+    """
+    O(1) membership index of already-seen places.
+    Can be preloaded from previous CSV exports or the `empresas` table so
+    known places are skipped before any detail/enrichment work is done.
+    """
+
+    def __init__(self):
+        self._keys: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, lead: Lead) -> bool:
+        key = place_key(lead.name, lead.source_url)
+        return key is not None and key in self._keys
+
+    def add_key(self, name: Optional[str], source_url: Optional[str]) -> bool:
+        """Records a place; returns False if it was already known."""
+        key = place_key(name, source_url)
+        if key is None:
+            return True
+        if key in self._keys:
+            return False
+        self._keys.add(key)
+        return True
+
+    def add(self, lead: Lead) -> bool:
+        """Records a lead; returns False if it is a duplicate."""
+        return self.add_key(lead.name, lead.source_url)
+
+    def load_csv(self, path: str) -> int:
+        """Loads name/source_url pairs from a leads_*.csv export."""
+        before = len(self._keys)
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                self.add_key(row.get("name"), row.get("source_url"))
+        return len(self._keys) - before
+
+    def load_csvs(self, pattern: str = "leads_*.csv") -> int:
+        """Loads every CSV matching the glob pattern."""
+        total = 0
+        for path in glob.glob(pattern):
+            try:
+                total += self.load_csv(path)
+            except Exception as e:
+                print(f"⚠️ Could not load {path}: {e}")
+        return total
+
+    def load_db(self, db, segment: Optional[str] = None) -> int:
+        """Loads known companies from `empresas` (site_url holds the Maps URL)."""
+        from app.schema import Empresa
+
+        before = len(self._keys)
+        query = db.query(Empresa.razao_social, Empresa.site_url)
+        if segment:
+            query = query.filter(Empresa.segmento_mercado == segment)
+        for name, site_url in query.yield_per(1000):
+            self.add_key(name, site_url)
+        return len(self._keys) - before
+
+    def extend(self, leads: Iterable[Lead]):
+        """Records every lead of a previous run."""
+        for lead in leads:
+            self.add(lead)
@@ -1,41 +1,188 @@
 import os
+import json
 import asyncio
-from typing import Optional
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import PromptTemplate
-from playwright.async_api import async_playwright
+from typing import Optional, List, Tuple
+import httpx
 from bs4 import BeautifulSoup
 from app.models import Lead
+from app.browser_pool import BrowserPool, get_browser_pool, DEFAULT_USER_AGENT
+from app.routing import RequestFilter, website_filter
+from app.llm_cache import LLMCache, content_key
+from app.rate_limit import LLMScheduler, get_llm_scheduler
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+# Below this many characters of visible text a page is assumed to be rendered by JS
+MIN_STATIC_TEXT = 200
+
+ENRICH_MODEL = "gemini-1.5-pro"
+
+ENRICH_PROMPT_TEMPLATE = """
+            Analyze the following company website content and extract strategic information.
+            
+            Company Name: {name}
+            Website Content:
+            {content}
+            
+            Return the following fields in a concise manner:
+            1. Sector (Industry)
+            2. Business Type (B2B, B2C, or Both)
+            3. Detailed Description (1 sentence summary)
+            4. Estimated Employee Count (if mentioned, otherwise "Unknown")
+            
+            Format: JSON
+            """
+
+BATCH_PROMPT_TEMPLATE = """
+            Analyze the website content of each company below and extract strategic information.
+            
+            {companies}
+            
+            For EACH company return the following fields in a concise manner:
+            1. Sector (Industry)
+            2. Business Type (B2B, B2C, or Both)
+            3. Detailed Description (1 sentence summary)
+            4. Estimated Employee Count (if mentioned, otherwise "Unknown")
+            
+            Format: a single JSON object mapping each company id (as a string) to an object
+            with the keys "Sector", "Business Type", "Detailed Description" and "Estimated Employee Count".
+            """
+
+# Rough token costs used when packing companies into one batched prompt
+BATCH_PROMPT_OVERHEAD_TOKENS = 200
+BATCH_ITEM_OVERHEAD_TOKENS = 30
 
 class LeadEnricher:
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        pool: Optional[BrowserPool] = None,
+        concurrency: Optional[int] = None,
+        cache: Optional[LLMCache] = None,
+        scheduler: Optional[LLMScheduler] = None,
+    ):
+        self.pool = pool or get_browser_pool()
+        self.request_filter: RequestFilter = website_filter()
+        self.concurrency = concurrency or int(os.getenv("ENRICH_CONCURRENCY", "5"))
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._http: Optional[httpx.AsyncClient] = None
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
         if not self.api_key:
             print("Warning: GEMINI_API_KEY not found. Enrichment will be skipped.")
             self.llm = None
         else:
-            self.llm = ChatGoogleGenerativeAI(model="gemini-1.5-pro", temperature=0, google_api_key=self.api_key)
+            # Imported here: langchain is slow to import and unused without a key
+            from langchain_google_genai import ChatGoogleGenerativeAI
+            self.llm = ChatGoogleGenerativeAI(model=ENRICH_MODEL, temperature=0, google_api_key=self.api_key)
+        self.model_name = ENRICH_MODEL
+        self.batch_mode = os.getenv("ENRICH_BATCH_MODE", "0") == "1"
+        self.batch_token_budget = int(os.getenv("ENRICH_BATCH_TOKEN_BUDGET", "12000"))
+        self.batch_max_items = int(os.getenv("ENRICH_BATCH_MAX_ITEMS", "8"))
+        if cache is None and self.llm and os.getenv("LLM_CACHE_ENABLED", "1") != "0":
+            cache = LLMCache()
+        self.cache = cache
+        self.scheduler = scheduler or get_llm_scheduler()
+
+    def _get_http(self) -> httpx.AsyncClient:
+        """Shared HTTP client so requests reuse pooled keep-alive connections."""
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                follow_redirects=True,
+                timeout=httpx.Timeout(15.0),
+                limits=httpx.Limits(max_connections=self.concurrency * 2, max_keepalive_connections=self.concurrency),
+                headers={"User-Agent": DEFAULT_USER_AGENT, "Accept-Language": "pt-BR,pt;q=0.9,en;q=0.8"},
+            )
+        return self._http
+
+    async def aclose(self):
+        """Closes the pooled HTTP client."""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    @staticmethod
+    def _extract_text(html: str) -> str:
+        soup = BeautifulSoup(html, HTML_PARSER)
+        # Remove scripts and styles
+        for script in soup(["script", "style", "nav", "footer"]):
+            script.extract()
+        return soup.get_text(separator=' ', strip=True)[:5000] # Limit context
+
+    async def _fetch_html_http(self, url: str) -> str:
+        response = await self._get_http().get(url)
+        response.raise_for_status()
+        if "html" not in response.headers.get("content-type", "html"):
+            return ""
+        return response.text
+
+    async def _fetch_html_browser(self, url: str) -> str:
+        async with self.pool.page(self.request_filter) as page:
+            await page.goto(url, timeout=30000)
+            return await page.content()
 
     async def _fetch_website_content(self, url: str) -> str:
         """
         Visits the website and extracts main text content.
+        Tries a plain HTTP GET first and only renders the page in the shared
+        browser when the static HTML has (almost) no text, i.e. a JS-heavy site.
         """
+        text = ""
         try:
-            async with async_playwright() as p:
-                browser = await p.chromium.launch(headless=True)
-                page = await browser.new_page()
-                await page.goto(url, timeout=30000)
-                content = await page.content()
-                await browser.close()
-                
-                soup = BeautifulSoup(content, 'html.parser')
-                # Remove scripts and styles
-                for script in soup(["script", "style", "nav", "footer"]):
-                    script.extract()
-                return soup.get_text(separator=' ', strip=True)[:5000] # Limit context
+            text = self._extract_text(await self._fetch_html_http(url))
+        except Exception as e:
+            print(f"HTTP fetch failed for {url}: {e}")
+            
+        if len(text) >= MIN_STATIC_TEXT:
+            return text
+            
+        try:
+            return self._extract_text(await self._fetch_html_browser(url)) or text
         except Exception as e:
             print(f"Error fetching {url}: {e}")
-            return ""
+            return text
+
+    def _cache_key(self, website_text: str) -> str:
+        # Same model + prompt + site text => same answer, so repeat companies skip the LLM
+        return content_key(self.model_name, ENRICH_PROMPT_TEMPLATE, website_text)
+
+    async def _invoke(self, prompt_text: str):
+        """All model calls go through the shared rate-limit/retry scheduler."""
+        return await self.scheduler.call(
+            lambda: self.llm.ainvoke(prompt_text),
+            estimated_tokens=len(prompt_text) // 4 + 500,  # prompt + expected answer
+        )
+
+    @staticmethod
+    def _parse_json(content: str):
+        return json.loads(content.replace('```json', '').replace('```', ''))
+
+    @staticmethod
+    def _apply(lead: Lead, data: dict):
+        lead.sector = data.get("Sector")
+        lead.business_type = data.get("Business Type")
+        lead.employees_estimate = data.get("Estimated Employee Count")
+
+    async def _enrich_text(self, lead: Lead, website_text: str) -> Lead:
+        """Single-company LLM call for already-fetched website text."""
+        cache_key = self._cache_key(website_text)
+        data = self.cache.get(cache_key) if self.cache else None
+        
+        if data is None:
+            try:
+                response = await self._invoke(ENRICH_PROMPT_TEMPLATE.format(name=lead.name, content=website_text))
+                data = self._parse_json(response.content)
+                if self.cache:
+                    self.cache.set(cache_key, data)
+            except Exception as e:
+                print(f"AI Error: {e}")
+                return lead
+            
+        self._apply(lead, data)
+        return lead
 
     async def enrich(self, lead: Lead) -> Lead:
         if not self.llm or not lead.website:
@@ -47,40 +194,115 @@ class LeadEnricher:
         if not website_text:
             return lead
 
-        prompt = PromptTemplate.from_template(
-            """
-            Analyze the following company website content and extract strategic information.
-            
-            Company Name: {name}
-            Website Content:
-            {content}
-            
-            Return the following fields in a concise manner:
-            1. Sector (Industry)
-            2. Business Type (B2B, B2C, or Both)
-            3. Detailed Description (1 sentence summary)
-            4. Estimated Employee Count (if mentioned, otherwise "Unknown")
+        return await self._enrich_text(lead, website_text)
+
+    def _pack_batches(self, items: List[Tuple[Lead, str]]) -> List[List[Tuple[Lead, str]]]:
+        """Groups (lead, text) pairs so each prompt stays under the token budget (~4 chars/token)."""
+        batches: List[List[Tuple[Lead, str]]] = []
+        current: List[Tuple[Lead, str]] = []
+        used = BATCH_PROMPT_OVERHEAD_TOKENS
+        for lead, text in items:
+            cost = (len(text) + len(lead.name)) // 4 + BATCH_ITEM_OVERHEAD_TOKENS
+            if current and (used + cost > self.batch_token_budget or len(current) >= self.batch_max_items):
+                batches.append(current)
+                current, used = [], BATCH_PROMPT_OVERHEAD_TOKENS
+            current.append((lead, text))
+            used += cost
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _enrich_batch(self, batch: List[Tuple[Lead, str]]):
+        """
+        Enriches several companies with one LLM request. Companies whose id is
+        missing from the answer (or the whole batch, on a parse error) fall back
+        to single calls.
+        """
+        if len(batch) == 1:
+            await self._enrich_text(*batch[0])
+            return
             
-            Format: JSON
-            """
+        companies = "\n".join(
+            f"### id: {i}\nCompany Name: {lead.name}\nWebsite Content:\n{text}\n"
+            for i, (lead, text) in enumerate(batch)
         )
-        
+        results = {}
         try:
-            response = await self.llm.ainvoke(prompt.format(name=lead.name, content=website_text))
-            content = response.content.replace('```json', '').replace('```', '')
-            import json
-            data = json.loads(content)
-            
-            lead.sector = data.get("Sector")
-            lead.business_type = data.get("Business Type")
-            lead.employees_estimate = data.get("Estimated Employee Count")
-            
+            response = await self._invoke(BATCH_PROMPT_TEMPLATE.format(companies=companies))
+            parsed = self._parse_json(response.content)
+            if isinstance(parsed, list):
+                parsed = {str(item.get("id")): item for item in parsed if isinstance(item, dict)}
+            results = {str(k): v for k, v in parsed.items() if isinstance(v, dict)}
         except Exception as e:
-            print(f"AI Error: {e}")
+            print(f"AI batch error ({len(batch)} companies), falling back to single calls: {e}")
             
-        return lead
+        fallback = []
+        for i, (lead, text) in enumerate(batch):
+            data = results.get(str(i))
+            if data is None:
+                fallback.append(self._enrich_text(lead, text))
+                continue
+            self._apply(lead, data)
+            if self.cache:
+                self.cache.set(self._cache_key(text), data)
+        if fallback:
+            await asyncio.gather(*fallback)
+
+    async def _enrich_leads_batched(self, leads: List[Lead]):
+        async def fetch(lead: Lead) -> Tuple[Lead, str]:
+            async with self._semaphore:
+                return lead, await self._fetch_website_content(lead.website)
+
+        fetched = await asyncio.gather(*(fetch(lead) for lead in leads if lead.website))
+        
+        pending: List[Tuple[Lead, str]] = []
+        for lead, text in fetched:
+            if not text:
+                continue
+            data = self.cache.get(self._cache_key(text)) if self.cache else None
+            if data is not None:
+                self._apply(lead, data)
+            else:
+                pending.append((lead, text))
+                
+        batches = self._pack_batches(pending)
+        print(f"Enriching {len(pending)} companies in {len(batches)} batched requests...")
+        
+        async def run(batch):
+            async with self._semaphore:
+                await self._enrich_batch(batch)
+
+        await asyncio.gather(*(run(batch) for batch in batches))
+
+    async def enrich_many(self, leads: list[Lead], batch: Optional[bool] = None) -> list[Lead]:
+        """
+        Enriches a list of leads in parallel (at most `concurrency` at a time).
+        In batch mode (ENRICH_BATCH_MODE=1 or batch=True) several companies
+        share one LLM request, packed by ENRICH_BATCH_TOKEN_BUDGET.
+        """
+        if not self.llm:
+            return leads
+            
+        use_batch = self.batch_mode if batch is None else batch
+        if use_batch:
+            await self._enrich_leads_batched(leads)
+            return leads
+
+        async def run(lead: Lead) -> Lead:
+            async with self._semaphore:
+                return await self.enrich(lead)
+
+        return list(await asyncio.gather(*(run(lead) for lead in leads)))
+
+    def report_stats(self):
+        """Prints LLM cache and rate-limit scheduler stats."""
+        if self.cache:
+            print(f"🗄️ {self.cache.stats()}")
+        print(f"⏱️ {self.scheduler.stats()}")
 
-    async def enrich_leads(self, leads: list[Lead]) -> list[Lead]:
-        """Enriches a list of leads in parallel"""
-        tasks = [self.enrich(lead) for lead in leads]
-        return await asyncio.gather(*tasks)
+    async def enrich_leads(self, leads: list[Lead], batch: Optional[bool] = None) -> list[Lead]:
+        """enrich_many() followed by a stats report."""
+        results = await self.enrich_many(leads, batch)
+        if self.llm:
+            self.report_stats()
+        return results
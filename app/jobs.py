@@ -0,0 +1,183 @@
+import os
+import json
+from datetime import timedelta
+from typing import Optional, Dict, Any, Iterable
+from sqlalchemy import select, update, func, or_, and_
+from sqlalchemy.orm import Session
+from app.schema import ScrapeJob
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+def enqueue_job(
+    db: Session,
+    query: str,
+    limit: int,
+    segment: Optional[str],
+    no_enrich: bool = False,
+    deep_enrich: bool = False,
+) -> ScrapeJob:
+    """Stores a scrape request for the workers to pick up."""
+    job = ScrapeJob(
+        status=JOB_QUEUED,
+        termo_busca=query,
+        limite=limit,
+        segmento_mercado=segment,
+        no_enrich=no_enrich,
+        deep_enrich=deep_enrich,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def claim_job(db: Session, worker_id: str) -> Optional[ScrapeJob]:
+    """
+    Atomically takes the oldest queued job. FOR UPDATE SKIP LOCKED lets any
+    number of workers poll the table without blocking on or double-claiming
+    the same row.
+    """
+    job = db.execute(
+        select(ScrapeJob)
+        .where(ScrapeJob.status == JOB_QUEUED)
+        .order_by(ScrapeJob.job_id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).scalar_one_or_none()
+    if job is None:
+        db.rollback()
+        return None
+    job.status = JOB_RUNNING
+    job.worker_id = worker_id
+    job.tentativas += 1
+    job.progresso = None
+    job.data_inicio = func.now()
+    job.data_heartbeat = func.now()
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def update_progress(db: Session, job_id: int, progress: Dict):
+    try:
+        job = db.get(ScrapeJob, job_id)
+        job.progresso = json.dumps(progress, ensure_ascii=False)
+        db.commit()
+    except Exception:
+        # Leave the session usable for the job's next write
+        db.rollback()
+        raise
+
+
+def finish_job(db: Session, job_id: int, result: Dict):
+    job = db.get(ScrapeJob, job_id)
+    job.status = JOB_DONE if result.get("status") == "success" else JOB_FAILED
+    job.resultado = json.dumps(result, ensure_ascii=False, default=str)
+    job.erro = result.get("message") if job.status == JOB_FAILED else None
+    job.data_fim = func.now()
+    db.commit()
+
+
+def fail_job(db: Session, job_id: int, error: Exception):
+    db.rollback()
+    job = db.get(ScrapeJob, job_id)
+    job.status = JOB_FAILED
+    job.erro = str(error)
+    job.data_fim = func.now()
+    db.commit()
+
+
+def heartbeat(db: Session, worker_id: str, job_ids: Iterable[int]):
+    """Renews the lease on the jobs this worker is still running."""
+    job_ids = list(job_ids)
+    if not job_ids:
+        return
+    db.execute(
+        update(ScrapeJob)
+        .where(ScrapeJob.job_id.in_(job_ids), ScrapeJob.worker_id == worker_id, ScrapeJob.status == JOB_RUNNING)
+        .values(data_heartbeat=func.now())
+    )
+    db.commit()
+
+
+def requeue_stale(db: Session, lease_seconds: Optional[float] = None, max_attempts: Optional[int] = None) -> int:
+    """
+    Puts back running jobs whose worker stopped renewing their lease (crash,
+    redeploy under a new hostname, fewer workers...), whichever worker held them.
+    Jobs that already used `max_attempts` tries are marked failed instead, so a
+    job that keeps killing its worker can't crash-loop it forever.
+    """
+    lease_seconds = lease_seconds or float(os.getenv("JOB_LEASE_SECONDS", "60"))
+    max_attempts = max_attempts or int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    cutoff = func.now() - timedelta(seconds=lease_seconds)
+    jobs = db.execute(
+        select(ScrapeJob)
+        .where(
+            ScrapeJob.status == JOB_RUNNING,
+            or_(
+                ScrapeJob.data_heartbeat < cutoff,
+                # Claimed before heartbeats were recorded
+                and_(ScrapeJob.data_heartbeat.is_(None), ScrapeJob.data_inicio < cutoff),
+            ),
+        )
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    requeued = 0
+    for job in jobs:
+        if job.tentativas >= max_attempts:
+            job.status = JOB_FAILED
+            job.erro = f"Worker {job.worker_id} stopped responding ({job.tentativas} attempts)"
+            job.data_fim = func.now()
+            print(f"🪦 Job {job.job_id} gave up after {job.tentativas} attempts")
+            continue
+        print(f"♻️ Job {job.job_id} lost its worker {job.worker_id}, requeued")
+        job.status = JOB_QUEUED
+        job.worker_id = None
+        requeued += 1
+    db.commit()
+    return requeued
+
+
+def release_jobs(db: Session, worker_id: str, job_ids: Iterable[int]) -> int:
+    """Requeues jobs interrupted by a worker shutdown; the interrupted try doesn't count."""
+    job_ids = list(job_ids)
+    if not job_ids:
+        return 0
+    released = db.execute(
+        update(ScrapeJob)
+        .where(ScrapeJob.job_id.in_(job_ids), ScrapeJob.worker_id == worker_id, ScrapeJob.status == JOB_RUNNING)
+        .values(status=JOB_QUEUED, worker_id=None, tentativas=ScrapeJob.tentativas - 1)
+    ).rowcount
+    db.commit()
+    return released
+
+
+def _load_json(value: Optional[str]) -> Any:
+    return json.loads(value) if value else None
+
+
+def job_summary(job: ScrapeJob) -> Dict:
+    """Public view of a job for GET /jobs/{id}."""
+    progress = _load_json(job.progresso) or {}
+    return {
+        "job_id": job.job_id,
+        "status": job.status,
+        "query": job.termo_busca,
+        "limit": job.limite,
+        "segment": job.segmento_mercado,
+        "attempts": job.tentativas,
+        "worker_id": job.worker_id,
+        "created_at": job.data_criacao.isoformat() if job.data_criacao else None,
+        "started_at": job.data_inicio.isoformat() if job.data_inicio else None,
+        "heartbeat_at": job.data_heartbeat.isoformat() if job.data_heartbeat else None,
+        "finished_at": job.data_fim.isoformat() if job.data_fim else None,
+        "elapsed": progress.get("elapsed"),
+        "progress": progress.get("stats", {}),
+        "timings": progress.get("timings", {}),
+        "result": _load_json(job.resultado),
+        "error": job.erro,
+    }
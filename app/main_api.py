@@ -1,6 +1,12 @@
-from fastapi import FastAPI, BackgroundTasks, HTTPException
+import time
+STARTED = time.perf_counter()  # before any import, to measure startup cost
+
+from fastapi import FastAPI, Depends, HTTPException
 from pydantic import BaseModel
-from app.services import process_lead_generation
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.jobs import enqueue_job, job_summary
+from app.schema import ScrapeJob
 from typing import Optional
 
 app = FastAPI(title="Lead Gen API", description="API para automação de coleta de leads (n8n/Make)")
@@ -12,28 +18,44 @@ class ScrapeRequest(BaseModel):
     no_enrich: bool = False
     deep_enrich: bool = False
 
+@app.on_event("startup")
+async def report_startup_time():
+    print(f"⏱️ API startup took {time.perf_counter() - STARTED:.2f}s")
+
 @app.get("/")
 def read_root():
     return {"status": "online", "service": "Lead Intelligence Platform"}
 
 @app.post("/scrape")
-async def trigger_scrape(request: ScrapeRequest, background_tasks: BackgroundTasks):
+def trigger_scrape(request: ScrapeRequest, db: Session = Depends(get_db)):
     """
-    Triggers a scraping job in the background.
+    Queues a scraping job for the workers (python -m app.worker).
     Returns immediately so n8n doesn't timeout.
     """
-    # Run in background because scraping takes time
-    background_tasks.add_task(
-        process_lead_generation, 
-        request.query, 
-        request.limit, 
-        request.segment, 
-        request.no_enrich, 
+    job = enqueue_job(
+        db,
+        request.query,
+        request.limit,
+        request.segment,
+        request.no_enrich,
         request.deep_enrich
     )
     
     return {
         "status": "accepted", 
-        "message": f"Scraping started for '{request.query}'",
+        "job_id": job.job_id,
+        "message": f"Scraping queued for '{request.query}'",
         "job_details": request.dict()
     }
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: int, db: Session = Depends(get_db)):
+    """
+    Job status for polling (n8n): per-stage counters (cards_seen, scraped,
+    detailed, enriched, deep_enriched, persisted...), stage timings in seconds
+    since the pipeline started, and the final result once done.
+    """
+    job = db.get(ScrapeJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_summary(job)
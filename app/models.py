@@ -11,6 +11,8 @@ class Lead(BaseModel):
     website: Optional[str] = None  # Kept as str to avoid strict validation errors during scraping
     phone: Optional[str] = None
     source_url: Optional[str] = None
+    rating: Optional[float] = None
+    category: Optional[str] = None  # Category shown on the Maps card (e.g. "Padaria")
     
     # Enrichment Fields (filled later by AI)
     sector: Optional[str] = None
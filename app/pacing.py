@@ -0,0 +1,56 @@
+import os
+import asyncio
+import random
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+
+class DomainPacer:
+    """
+    Per-domain pacing policy: guarantees at least `min_interval` seconds
+    (plus random jitter) between two requests to the same domain, while
+    requests to different domains never wait on each other.
+    Callers reserve a slot and sleep outside the lock, so concurrent tasks
+    are spaced out instead of serialized.
+    """
+
+    def __init__(self, min_interval: Optional[float] = None, jitter: Optional[float] = None):
+        self.min_interval = min_interval if min_interval is not None else float(os.getenv("PACING_MIN_INTERVAL", "3"))
+        self.jitter = jitter if jitter is not None else float(os.getenv("PACING_JITTER", "2"))
+        self._next_slot: Dict[str, float] = {}
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _domain(url_or_domain: str) -> str:
+        return urlparse(url_or_domain).netloc or url_or_domain
+
+    async def wait(self, url_or_domain: str, interval: Optional[float] = None):
+        """
+        Sleeps until the next request to this domain is allowed.
+        `interval` overrides the default spacing for lighter requests
+        (jitter is then up to half of it).
+        """
+        domain = self._domain(url_or_domain)
+        if interval is None:
+            spacing = self.min_interval + random.uniform(0, self.jitter)
+        else:
+            spacing = interval + random.uniform(0, interval / 2)
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            slot = max(now, self._next_slot.get(domain, 0.0))
+            self._next_slot[domain] = slot + spacing
+        delay = slot - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+_pacer: Optional[DomainPacer] = None
+
+
+def get_domain_pacer() -> DomainPacer:
+    """Returns the process-wide pacer so concurrent jobs share one budget."""
+    global _pacer
+    if _pacer is None:
+        _pacer = DomainPacer()
+    return _pacer
@@ -0,0 +1,150 @@
+from typing import List, Dict, Optional
+from sqlalchemy import select, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app.models import Lead
+from app.dedup import normalize_name, contact_key
+from app import database
+from app.schema import Empresa, Contato, LogScraping
+
+
+def log_success(db: Session, query: str):
+    """Audit log entry for a scraping run."""
+    log = LogScraping(
+        url_origem="Google Maps",
+        status_extracao="Sucesso",
+        termo_busca=query,
+        ferramenta_usada="GoogleMapsScraper"
+    )
+    db.add(log)
+    db.commit()
+
+
+def log_failure(db: Session, query: str, error: Exception):
+    """Rolls back the session and records the failure in the audit log."""
+    db.rollback()
+    fail_log = LogScraping(
+        url_origem="Google Maps",
+        status_extracao=f"Erro: {str(error)}"[:50],
+        termo_busca=query
+    )
+    db.add(fail_log)
+    db.commit()
+
+
+def save_leads(db: Session, leads: List[Lead], segment: str) -> Dict[str, int]:
+    """
+    Adds companies (deduped by normalized name within `segment`, or by CNPJ)
+    and general contacts (deduped by empresa_id + contact_key) for `leads`
+    to the session without committing, in a fixed number of round trips:
+    one SELECT for known companies and one INSERT ... ON CONFLICT each for
+    new companies and new contacts, so re-runs write nothing.
+    Returns {"new_companies": ..., "new_contacts": ...}.
+    """
+    if not leads:
+        return {"new_companies": 0, "new_contacts": 0}
+
+    by_name: Dict[str, int] = {}
+    by_cnpj: Dict[str, int] = {}
+
+    def remember(rows):
+        for empresa_id, nome_normalizado, cnpj in rows:
+            if nome_normalizado:
+                by_name[nome_normalizado] = empresa_id
+            if cnpj:
+                by_cnpj[cnpj] = empresa_id
+
+    def company_id(lead: Lead) -> Optional[int]:
+        return by_name.get(normalize_name(lead.name)) or (by_cnpj.get(lead.cnpj) if lead.cnpj else None)
+
+    columns = (Empresa.empresa_id, Empresa.nome_normalizado, Empresa.cnpj)
+    names = {normalize_name(lead.name) for lead in leads}
+    cnpjs = {lead.cnpj for lead in leads if lead.cnpj}
+    # Hits the (segmento_mercado, nome_normalizado) unique index instead of scanning razao_social
+    known = (Empresa.segmento_mercado == segment) & Empresa.nome_normalizado.in_(names)
+    remember(db.execute(select(*columns).where(or_(known, Empresa.cnpj.in_(cnpjs)))))
+
+    new_rows: Dict[str, Dict] = {}
+    new_cnpjs = set()
+    for lead in leads:
+        key = normalize_name(lead.name)
+        if company_id(lead) is not None or key in new_rows or (lead.cnpj and lead.cnpj in new_cnpjs):
+            continue
+        new_rows[key] = dict(
+            razao_social=lead.name,
+            nome_normalizado=key,
+            nome_fantasia=lead.name,
+            site_url=lead.source_url, # Source URL for now, website if enriched
+            setor_cnae=lead.sector,
+            tamanho_colaboradores=lead.employees_estimate,
+            cidade=lead.address, # Basic mapping
+            segmento_mercado=segment,
+            cnpj=lead.cnpj,
+            faturamento_estimado=lead.capital_social
+        )
+        if lead.cnpj:
+            new_cnpjs.add(lead.cnpj)
+
+    count_new = 0
+    if new_rows:
+        inserted = db.execute(
+            pg_insert(Empresa)
+            .values(list(new_rows.values()))
+            # Either unique key (CNPJ or segment + normalized name) may already exist
+            .on_conflict_do_nothing()
+            .returning(*columns)
+        ).all()
+        remember(inserted)
+        count_new = len(inserted)
+        # Rows skipped because another writer stored the same company meanwhile
+        skipped = [row for key, row in new_rows.items() if key not in by_name]
+        if skipped:
+            skipped_names = (Empresa.segmento_mercado == segment) & Empresa.nome_normalizado.in_([row["nome_normalizado"] for row in skipped])
+            skipped_cnpjs = Empresa.cnpj.in_([row["cnpj"] for row in skipped if row["cnpj"]])
+            remember(db.execute(select(*columns).where(or_(skipped_names, skipped_cnpjs))))
+
+    # Maps gives the business, not a person, so we store a general contact
+    contacts: Dict[tuple, Dict] = {}
+    for lead in leads:
+        empresa_id = company_id(lead)
+        if not (lead.phone or lead.website) or empresa_id is None:
+            continue
+        key = contact_key(lead.phone)
+        contacts.setdefault((empresa_id, key), dict(
+            empresa_id=empresa_id,
+            nome_completo="Contato Geral", # Placeholder
+            telefone_direto=lead.phone,
+            email_corporativo=None, # Maps doesn't give email easily
+            chave_contato=key
+        ))
+
+    count_contacts = 0
+    if contacts:
+        # Contacts already stored on a previous run are left untouched
+        count_contacts = len(db.execute(
+            pg_insert(Contato)
+            .values(list(contacts.values()))
+            .on_conflict_do_nothing(index_elements=[Contato.empresa_id, Contato.chave_contato])
+            .returning(Contato.contato_id)
+        ).all())
+
+    return {"new_companies": count_new, "new_contacts": count_contacts}
+
+
+def persist_leads(leads: List[Lead], query: str, segment: str) -> Dict:
+    """Saves leads (companies + general contacts) and an audit log entry."""
+    print(f"💾 Saving to Database (Segment: {segment})...")
+    db = database.SessionLocal()
+    try:
+        log_success(db, query)
+        count_new = save_leads(db, leads, segment)["new_companies"]
+        db.commit()
+        print(f"✅ Data persisted! ({count_new} new companies added)")
+        return {"status": "success", "leads_found": len(leads), "new_companies": count_new}
+
+    except Exception as e:
+        print(f"❌ Database Error: {e}")
+        log_failure(db, query, e)
+        return {"status": "error", "message": str(e)}
+    finally:
+        db.close()
@@ -0,0 +1,345 @@
+import os
+import csv
+import time
+import asyncio
+from contextlib import aclosing
+from typing import Optional, List, Dict, Callable, Awaitable, TYPE_CHECKING
+from app.models import Lead
+from app.scraper import GoogleMapsScraper
+from app.enrichment import LeadEnricher
+from app.scrapers.cnpj import CNPJScraper
+from app.dedup import LeadIndex
+from app import database
+from app.persistence import log_success, log_failure, save_leads
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+# Marks the end of a stream; each stage forwards it once all its workers stop
+_STOP = object()
+
+
+class LeadPipeline:
+    """
+    Streaming scrape (GoogleMapsScraper.iter_leads) -> details -> AI enrich -> CNPJ -> persist pipeline.
+    Stages are connected by bounded asyncio queues (backpressure) and each
+    has its own worker count, so a lead reaches the CSV/DB as soon as it has
+    gone through every stage instead of waiting for the whole batch.
+
+    The Maps scroll session holds one browser pool slot until it ends, so its
+    output queue is unbounded (at most `limit` leads): it never waits on the
+    downstream stages that need the other slots to drain it.
+    """
+
+    def __init__(
+        self,
+        scraper: GoogleMapsScraper,
+        enricher: Optional[LeadEnricher] = None,
+        cnpj_scraper: Optional[CNPJScraper] = None,
+        segment: Optional[str] = None,
+        csv_path: Optional[str] = None,
+        details: bool = True,
+        queue_size: Optional[int] = None,
+        on_progress: Optional[Callable[[Dict], Awaitable[None]]] = None,
+    ):
+        self.scraper = scraper
+        self.enricher = enricher
+        self.cnpj_scraper = cnpj_scraper
+        self.segment = segment
+        self.csv_path = csv_path
+        self.details = details
+        self.queue_size = queue_size or int(os.getenv("PIPELINE_QUEUE_SIZE", "10"))
+        self.persist_batch = int(os.getenv("PIPELINE_PERSIST_BATCH", "10"))
+        # How long a batching stage (or the DB sink) waits for more leads before running a partial batch
+        self.batch_wait = float(os.getenv("PIPELINE_BATCH_WAIT", "1"))
+        self.workers = {
+            "details": int(os.getenv("PIPELINE_DETAIL_WORKERS", str(scraper.detail_concurrency))),
+            "enrich": int(os.getenv("PIPELINE_ENRICH_WORKERS", "4")),
+            # Enough workers to keep both the search and page limits of CNPJScraper busy
+            "deep": int(os.getenv(
+                "PIPELINE_DEEP_WORKERS",
+                str(cnpj_scraper.search_concurrency + cnpj_scraper.page_concurrency) if cnpj_scraper else "2",
+            )),
+        }
+        self.stats: Dict[str, int] = {
+            "cards_seen": 0,
+            "scraped": 0,
+            "detailed": 0,
+            "enriched": 0,
+            "deep_enriched": 0,
+            "persisted": 0,
+            "new_companies": 0,
+            "new_contacts": 0,
+        }
+        self.db_error: Optional[str] = None
+        # Per stage: seconds since start of its first / last item, and time spent working
+        self.timings: Dict[str, Dict[str, Optional[float]]] = {}
+        self.on_progress = on_progress
+        self.progress_interval = float(os.getenv("PIPELINE_PROGRESS_INTERVAL", "2"))
+        self._started = time.monotonic()
+
+    # Stages (each takes and returns a batch of leads; most use batches of one)
+
+    async def _detail(self, leads: List[Lead]) -> List[Lead]:
+        leads = [await self.scraper.scrape_details(lead) for lead in leads]
+        self.stats["detailed"] += len(leads)
+        return leads
+
+    async def _enrich(self, leads: List[Lead]) -> List[Lead]:
+        # In ENRICH_BATCH_MODE the collected leads share LLM requests
+        leads = await self.enricher.enrich_many(leads)
+        self.stats["enriched"] += len(leads)
+        return leads
+
+    async def _deep(self, leads: List[Lead]) -> List[Lead]:
+        leads = [await self.cnpj_scraper.enrich_lead(lead, self.scraper.pool) for lead in leads]
+        self.stats["deep_enriched"] += len(leads)
+        return leads
+
+    def _stages(self) -> List[tuple]:
+        """(name, fn, batch size) for every enabled stage."""
+        stages = []
+        if self.details:
+            stages.append(("details", self._detail, 1))
+        if self.enricher is not None and self.enricher.llm:
+            batch_size = self.enricher.batch_max_items if self.enricher.batch_mode else 1
+            stages.append(("enrich", self._enrich, batch_size))
+        if self.cnpj_scraper is not None:
+            stages.append(("deep", self._deep, 1))
+        return stages
+
+    # Progress
+
+    def _timing(self, stage: str) -> Dict[str, Optional[float]]:
+        return self.timings.setdefault(stage, {"started": None, "finished": None, "busy": 0.0})
+
+    def _mark(self, stage: str, event: str):
+        timing = self._timing(stage)
+        if event == "finished" or timing[event] is None:
+            timing[event] = round(time.monotonic() - self._started, 2)
+
+    def _add_busy(self, stage: str, seconds: float):
+        timing = self._timing(stage)
+        timing["busy"] = round(timing["busy"] + seconds, 2)
+
+    def progress(self) -> Dict:
+        """Snapshot of the counters and per-stage timings."""
+        return {
+            "elapsed": round(time.monotonic() - self._started, 2),
+            "stats": dict(self.stats),
+            "timings": {stage: dict(timing) for stage, timing in self.timings.items()},
+        }
+
+    async def _report(self):
+        try:
+            await self.on_progress(self.progress())
+        except Exception as e:
+            print(f"⚠️ Progress report failed: {e}")
+
+    async def _report_periodically(self, stop: asyncio.Event):
+        # Stopped via the event (not cancel) so a report is never cut off mid-write
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self.progress_interval)
+            except asyncio.TimeoutError:
+                await self._report()
+
+    # Plumbing
+
+    def _check_pool(self, stages: List[tuple]):
+        """The feed holds a slot for the whole scrape; page-using stages need at least one more."""
+        needed = 2 if stages else 1
+        if self.scraper.pool.size < needed:
+            raise ValueError(
+                f"Browser pool has {self.scraper.pool.size} slot(s) but this pipeline needs at least {needed} "
+                "(one for the Maps feed, one for place/website/CNPJ pages); raise BROWSER_POOL_SIZE"
+            )
+
+    async def _produce(self, query: str, limit: int, index: Optional[LeadIndex], outbox: asyncio.Queue):
+        self._mark("scrape", "started")
+        started = time.monotonic()
+        try:
+            async with aclosing(self.scraper.iter_leads(query, limit, index, self.stats)) as stream:
+                async for lead in stream:
+                    self.stats["scraped"] += 1
+                    await outbox.put(lead)
+        finally:
+            # The scroll session is busy for its whole lifetime
+            self._add_busy("scrape", time.monotonic() - started)
+            self._mark("scrape", "finished")
+            await outbox.put(_STOP)
+
+    async def _collect(self, inbox: asyncio.Queue, first: Lead, batch_size: int) -> List[Lead]:
+        """Adds leads arriving within `batch_wait` seconds to `first`, up to `batch_size`."""
+        batch = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                lead = await asyncio.wait_for(inbox.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            if lead is _STOP:
+                # Leave it for the next get() so the worker still shuts down
+                await inbox.put(_STOP)
+                break
+            batch.append(lead)
+        return batch
+
+    async def _run_stage(
+        self,
+        name: str,
+        fn: Callable[[List[Lead]], Awaitable[List[Lead]]],
+        inbox: asyncio.Queue,
+        outbox: asyncio.Queue,
+        batch_size: int = 1,
+    ):
+        async def worker():
+            while True:
+                lead = await inbox.get()
+                if lead is _STOP:
+                    # Let sibling workers see the marker too
+                    await inbox.put(_STOP)
+                    return
+                batch = await self._collect(inbox, lead, batch_size) if batch_size > 1 else [lead]
+                self._mark(name, "started")
+                started = time.monotonic()
+                try:
+                    batch = await fn(batch)
+                except Exception as e:
+                    print(f"⚠️ Stage '{name}' failed for {', '.join(lead.name for lead in batch)}: {e}")
+                self._add_busy(name, time.monotonic() - started)
+                for lead in batch:
+                    await outbox.put(lead)
+
+        await asyncio.gather(*(worker() for _ in range(max(1, self.workers[name]))))
+        self._mark(name, "finished")
+        await outbox.put(_STOP)
+
+    async def _sink(self, query: str, inbox: asyncio.Queue):
+        """
+        Appends each lead to the CSV and writes micro-batches to the database:
+        every `persist_batch` leads, or `batch_wait` seconds after the oldest
+        unsaved lead arrived, so slow upstream stages don't hold back the first rows.
+        """
+        csv_file = None
+        writer = None
+        if self.csv_path:
+            csv_file = open(self.csv_path, "w", newline="", encoding="utf-8")
+            writer = csv.DictWriter(csv_file, fieldnames=list(Lead.model_fields.keys()))
+            writer.writeheader()
+
+        db = None
+        if self.segment:
+            print(f"💾 Saving to Database (Segment: {self.segment})...")
+            db = database.AsyncSessionLocal()
+            try:
+                await db.run_sync(log_success, query)
+            except Exception as e:
+                await self._fail_db(db, query, e)
+                db = None
+
+        batch: List[Lead] = []
+        flush_at = 0.0
+        try:
+            while True:
+                if batch:
+                    try:
+                        lead = await asyncio.wait_for(inbox.get(), timeout=max(0.0, flush_at - time.monotonic()))
+                    except asyncio.TimeoutError:
+                        lead = None
+                else:
+                    lead = await inbox.get()
+                done = lead is _STOP
+                if lead is not None and not done:
+                    if writer is not None:
+                        writer.writerow(lead.model_dump())
+                        csv_file.flush()
+                    if not batch:
+                        flush_at = time.monotonic() + self.batch_wait
+                    batch.append(lead)
+
+                if batch and (done or lead is None or len(batch) >= self.persist_batch):
+                    if db is not None:
+                        self._mark("persist", "started")
+                        started = time.monotonic()
+                        try:
+                            await self._write_batch(db, batch)
+                        except Exception as e:
+                            await self._fail_db(db, query, e)
+                            db = None
+                        self._add_busy("persist", time.monotonic() - started)
+                    batch = []
+
+                if done:
+                    if "persist" in self.timings:
+                        self._mark("persist", "finished")
+                    break
+        finally:
+            if csv_file is not None:
+                csv_file.close()
+            if db is not None:
+                await db.close()
+
+    async def _write_batch(self, db: "AsyncSession", leads: List[Lead]):
+        # save_leads is plain Session code; run_sync drives it on the async connection
+        counts = await db.run_sync(save_leads, leads, self.segment)
+        self.stats["new_companies"] += counts["new_companies"]
+        self.stats["new_contacts"] += counts["new_contacts"]
+        await db.commit()
+        self.stats["persisted"] += len(leads)
+
+    async def _fail_db(self, db: "AsyncSession", query: str, error: Exception):
+        """Records a DB failure; never raises, so an outage can't take down the other stages."""
+        print(f"❌ Database Error: {error}")
+        self.db_error = str(error)
+        try:
+            await db.run_sync(log_failure, query, error)
+        except Exception as log_error:
+            print(f"⚠️ Could not write the failure to the audit log: {log_error}")
+        finally:
+            try:
+                await db.close()
+            except Exception:
+                pass
+
+    async def run(self, query: str, limit: int, index: Optional[LeadIndex] = None) -> Dict:
+        """Runs every stage concurrently and returns a summary of the job."""
+        self._started = time.monotonic()
+        stages = self._stages()
+        self._check_pool(stages)
+        # queues[0] is fed by the scroll session, which must never block while holding its page
+        queues = [asyncio.Queue(maxsize=0 if i == 0 else self.queue_size) for i in range(len(stages) + 1)]
+
+        stop = asyncio.Event()
+        reporter = asyncio.create_task(self._report_periodically(stop)) if self.on_progress else None
+        try:
+            # If any stage fails, the TaskGroup cancels the others, so no worker
+            # is left waiting on a queue (or holding a browser page) forever
+            async with asyncio.TaskGroup() as group:
+                group.create_task(self._produce(query, limit, index, queues[0]))
+                for i, (name, fn, batch_size) in enumerate(stages):
+                    group.create_task(self._run_stage(name, fn, queues[i], queues[i + 1], batch_size))
+                group.create_task(self._sink(query, queues[-1]))
+        except ExceptionGroup as errors:
+            # Surface the original error to callers, as gather() used to
+            raise errors.exceptions[0]
+        finally:
+            if reporter is not None:
+                stop.set()
+                await reporter
+                await self._report()
+
+        elapsed = time.monotonic() - self._started
+        print(f"✅ Pipeline finished in {elapsed:.1f}s: {self.stats}")
+        if any(name == "enrich" for name, _, _ in stages):
+            self.enricher.report_stats()
+        if self.db_error:
+            return {"status": "error", "message": self.db_error, "leads_found": self.stats["scraped"]}
+        return {
+            "status": "success",
+            "leads_found": self.stats["scraped"],
+            "new_companies": self.stats["new_companies"],
+        }
@@ -0,0 +1,102 @@
+import os
+import time
+import random
+import asyncio
+from typing import Optional, Callable, Awaitable, TypeVar
+
+T = TypeVar("T")
+
+# Exception names / message fragments that mean "slow down and retry"
+RETRYABLE_ERROR_NAMES = ("ResourceExhausted", "TooManyRequests", "RateLimitError", "ServiceUnavailable", "DeadlineExceeded")
+RETRYABLE_MESSAGES = ("429", "quota", "rate limit", "resource exhausted", "503", "unavailable", "deadline exceeded")
+
+
+class TokenBucket:
+    """
+    Classic token bucket refilled continuously at `rate_per_minute`.
+    `acquire(n)` waits until n tokens are available; waiters are served in order.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0):
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                await asyncio.sleep((amount - self._tokens) / self.rate_per_second)
+
+
+def is_retryable(error: Exception) -> bool:
+    if type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    message = str(error).lower()
+    return any(fragment in message for fragment in RETRYABLE_MESSAGES)
+
+
+class LLMScheduler:
+    """
+    Wraps LLM calls with request/min and token/min buckets plus exponential
+    backoff with full jitter on quota and transient errors. Calls that still
+    fail after `max_retries` re-raise the last error.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        backoff_base: Optional[float] = None,
+        backoff_max: Optional[float] = None,
+    ):
+        self.requests = TokenBucket(requests_per_minute or float(os.getenv("GEMINI_RPM", "60")))
+        self.tokens = TokenBucket(tokens_per_minute or float(os.getenv("GEMINI_TPM", "250000")))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("LLM_MAX_RETRIES", "5"))
+        self.backoff_base = backoff_base or float(os.getenv("LLM_BACKOFF_BASE", "2"))
+        self.backoff_max = backoff_max or float(os.getenv("LLM_BACKOFF_MAX", "60"))
+        self.retries = 0
+        self.failures = 0
+
+    async def call(self, fn: Callable[[], Awaitable[T]], estimated_tokens: int = 1) -> T:
+        attempt = 0
+        while True:
+            await self.requests.acquire(1)
+            await self.tokens.acquire(estimated_tokens)
+            try:
+                return await fn()
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    self.failures += 1
+                    raise
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+                attempt += 1
+                self.retries += 1
+                print(f"⏳ LLM rate limited ({type(e).__name__}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    def stats(self) -> str:
+        return f"LLM scheduler: {self.retries} retries, {self.failures} failed calls"
+
+
+_scheduler: Optional[LLMScheduler] = None
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Returns the process-wide scheduler so concurrent jobs share one quota."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler()
+    return _scheduler
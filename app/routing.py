@@ -0,0 +1,121 @@
+import os
+from collections import Counter
+from typing import Iterable, Dict, List
+from playwright.async_api import Page, Route, Response
+
+# Rough transfer sizes used to estimate savings before any response of that
+# type has been observed (bytes).
+DEFAULT_RESOURCE_SIZES = {
+    "image": 25_000,
+    "media": 200_000,
+    "font": 35_000,
+    "stylesheet": 20_000,
+    "script": 60_000,
+}
+FALLBACK_RESOURCE_SIZE = 5_000
+
+ANALYTICS_PATTERNS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "connect.facebook.net",
+    "hotjar.com",
+    "/gen_204",
+)
+
+# Map tiles / imagery are fetched as images *and* xhr, so they are matched by URL
+MAPS_TILE_PATTERNS = (
+    "/maps/vt",
+    "/kh/v=",
+    "khms",
+    "streetviewpixels",
+)
+
+MAPS_ALLOWED_TYPES = ("document", "script", "xhr", "fetch", "stylesheet")
+WEBSITE_ALLOWED_TYPES = ("document", "script", "xhr", "fetch")
+CNPJ_ALLOWED_TYPES = ("document", "script")
+
+
+class RequestFilter:
+    """
+    Playwright routing layer that aborts every request whose resource type is
+    not in the allow-list (or whose URL matches a blocked pattern) and keeps
+    per-type counters plus an estimate of the bytes saved.
+    The allow-list can be overridden with ROUTING_ALLOW_<NAME>=document,script,...
+    and routing disabled entirely with ROUTING_ENABLED=0.
+    """
+
+    def __init__(self, name: str, allowed_types: Iterable[str], blocked_patterns: Iterable[str] = ()):
+        self.name = name
+        override = os.getenv(f"ROUTING_ALLOW_{name.upper()}")
+        if override:
+            allowed_types = [t.strip() for t in override.split(",") if t.strip()]
+        self.allowed_types = set(allowed_types)
+        self.blocked_patterns = tuple(blocked_patterns)
+        self.enabled = os.getenv("ROUTING_ENABLED", "1") != "0"
+
+        self.blocked: Counter = Counter()
+        self.allowed: Counter = Counter()
+        self._observed_bytes: Dict[str, List[int]] = {}  # type -> [total bytes, responses]
+
+    def _should_block(self, resource_type: str, url: str) -> bool:
+        if resource_type == "document":
+            return False
+        if resource_type not in self.allowed_types:
+            return True
+        return any(pattern in url for pattern in self.blocked_patterns)
+
+    async def _handle(self, route: Route):
+        request = route.request
+        resource_type = request.resource_type
+        if self._should_block(resource_type, request.url):
+            self.blocked[resource_type] += 1
+            await route.abort()
+        else:
+            self.allowed[resource_type] += 1
+            await route.continue_()
+
+    def _on_response(self, response: Response):
+        length = response.headers.get("content-length")
+        if not length or not length.isdigit():
+            return
+        stats = self._observed_bytes.setdefault(response.request.resource_type, [0, 0])
+        stats[0] += int(length)
+        stats[1] += 1
+
+    async def attach(self, page: Page):
+        """Installs the route handler on a page."""
+        if not self.enabled:
+            return
+        await page.route("**/*", self._handle)
+        page.on("response", self._on_response)
+
+    def _average_size(self, resource_type: str) -> int:
+        total, count = self._observed_bytes.get(resource_type, (0, 0))
+        if count:
+            return total // count
+        return DEFAULT_RESOURCE_SIZES.get(resource_type, FALLBACK_RESOURCE_SIZE)
+
+    @property
+    def estimated_bytes_saved(self) -> int:
+        return sum(count * self._average_size(rtype) for rtype, count in self.blocked.items())
+
+    def summary(self) -> str:
+        total = sum(self.blocked.values())
+        by_type = ", ".join(f"{rtype}={count}" for rtype, count in self.blocked.most_common())
+        return (
+            f"{self.name}: blocked {total} requests ({by_type or 'none'}), "
+            f"~{self.estimated_bytes_saved / 1_000_000:.1f} MB saved"
+        )
+
+
+def maps_filter() -> RequestFilter:
+    return RequestFilter("maps", MAPS_ALLOWED_TYPES, MAPS_TILE_PATTERNS + ANALYTICS_PATTERNS)
+
+
+def website_filter() -> RequestFilter:
+    return RequestFilter("website", WEBSITE_ALLOWED_TYPES, ANALYTICS_PATTERNS)
+
+
+def cnpj_filter() -> RequestFilter:
+    return RequestFilter("cnpj", CNPJ_ALLOWED_TYPES, ANALYTICS_PATTERNS)
@@ -1,14 +1,19 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
 
 class Empresa(Base):
     __tablename__ = "empresas"
+    __table_args__ = (
+        # One company per normalized name within a segment
+        UniqueConstraint("segmento_mercado", "nome_normalizado", name="uq_empresas_segmento_nome"),
+    )
 
     empresa_id = Column(Integer, primary_key=True, index=True)
     cnpj = Column(String(18), unique=True, nullable=True) # Uniqueness check
     razao_social = Column(String(255), nullable=False) # We'll use Name scaped as Razao Social initially
+    nome_normalizado = Column(String(255), nullable=True) # normalize_name(razao_social), dedup key
     nome_fantasia = Column(String(255), nullable=True)
     site_url = Column(String(255), nullable=True)
     linkedin_empresa = Column(String(255), nullable=True)
@@ -26,6 +31,10 @@ class Empresa(Base):
 
 class Contato(Base):
     __tablename__ = "contatos"
+    __table_args__ = (
+        # Re-running a wave must not duplicate contacts
+        UniqueConstraint("empresa_id", "chave_contato", name="uq_contatos_empresa_chave"),
+    )
 
     contato_id = Column(Integer, primary_key=True, index=True)
     empresa_id = Column(Integer, ForeignKey("empresas.empresa_id"))
@@ -34,6 +43,7 @@ class Contato(Base):
     cargo = Column(String(150), nullable=True)
     email_corporativo = Column(String(255), nullable=True) # Unique constrained removed for flexibility
     telefone_direto = Column(String(20), nullable=True)
+    chave_contato = Column(String(255), nullable=True) # dedup.contact_key(telefone, email)
     linkedin_pessoal = Column(String(255), nullable=True)
     perfil_tomador_decisao = Column(Boolean, default=False)
     
@@ -51,3 +61,25 @@ class LogScraping(Base):
     status_extracao = Column(String(50)) # 'Sucesso', 'Erro'
     termo_busca = Column(String(255))
     data_hora = Column(DateTime(timezone=True), server_default=func.now())
+
+class ScrapeJob(Base):
+    __tablename__ = "scrape_jobs"
+
+    job_id = Column(Integer, primary_key=True, index=True)
+    status = Column(String(20), nullable=False, default="queued", index=True) # 'queued', 'running', 'done', 'failed'
+    termo_busca = Column(String(255), nullable=False)
+    limite = Column(Integer, nullable=False, default=10)
+    segmento_mercado = Column(String(100), nullable=True)
+    no_enrich = Column(Boolean, default=False)
+    deep_enrich = Column(Boolean, default=False)
+
+    tentativas = Column(Integer, nullable=False, default=0)
+    worker_id = Column(String(100), nullable=True) # host-w<slot> id of the worker that claimed it (stable across restarts)
+    progresso = Column(Text, nullable=True) # JSON LeadPipeline.progress() snapshot: counters + stage timings
+    resultado = Column(Text, nullable=True) # JSON summary returned by process_lead_generation
+    erro = Column(Text, nullable=True)
+
+    data_criacao = Column(DateTime(timezone=True), server_default=func.now())
+    data_inicio = Column(DateTime(timezone=True), nullable=True)
+    data_fim = Column(DateTime(timezone=True), nullable=True)
+    data_heartbeat = Column(DateTime(timezone=True), nullable=True) # lease: renewed by the running worker, stale => requeued
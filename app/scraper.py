@@ -1,28 +1,201 @@
+import os
 import asyncio
-import random
-from typing import List, Optional
-from playwright.async_api import async_playwright, Page, Locator
+from contextlib import aclosing
+from typing import List, Optional, Dict, Iterable, Tuple, Union, AsyncIterator
+from playwright.async_api import Page, Locator
 from app.models import Lead
+from app.browser_pool import BrowserPool, get_browser_pool
+from app.pacing import DomainPacer, get_domain_pacer
+from app.dedup import LeadIndex
+from app.routing import RequestFilter, maps_filter
+
+MAPS_SEARCH_URL = "https://www.google.com/maps/search/{query}"
+
+# Runs inside the page: returns all result cards after `cursor` in one batch.
+# Rating is the "4,5" badge; category is the first segment of the info line.
+HARVEST_CARDS_JS = """
+(feed, cursor) => {
+    const cards = feed.querySelectorAll('div.Nv2PK');
+    const out = [];
+    for (let i = cursor; i < cards.length; i++) {
+        const card = cards[i];
+        const nameEl = card.querySelector('.fontHeadlineSmall');
+        const linkEl = card.querySelector('a.hfpxzc');
+        const ratingEl = card.querySelector('span.MW4etd');
+        let category = null;
+        const info = card.querySelectorAll('.W4Efsd > .W4Efsd');
+        if (info.length) {
+            const first = info[0].querySelector('span > span');
+            if (first) category = first.textContent.trim() || null;
+        }
+        let rating = null;
+        if (ratingEl) {
+            const value = parseFloat(ratingEl.textContent.replace(',', '.'));
+            rating = isNaN(value) ? null : value;
+        }
+        out.push({
+            name: nameEl ? nameEl.textContent.trim() : null,
+            href: linkEl ? linkEl.getAttribute('href') : null,
+            rating: rating,
+            category: category,
+        });
+    }
+    return { total: cards.length, cards: out };
+}
+"""
+
+# Runs inside a place page: reads address, phone and website from the info panel.
+PLACE_DETAILS_JS = """
+() => {
+    const valueOf = (el) => {
+        if (!el) return null;
+        const shown = el.querySelector('.Io6YTe');
+        if (shown && shown.textContent.trim()) return shown.textContent.trim();
+        const label = el.getAttribute('aria-label') || '';
+        const idx = label.indexOf(':');
+        return (idx >= 0 ? label.slice(idx + 1) : label).trim() || null;
+    };
+    let website = null;
+    const site = document.querySelector('a[data-item-id="authority"]');
+    if (site) {
+        website = site.getAttribute('href');
+        if (website && website.includes('/url?q=')) {
+            website = new URL(website, location.href).searchParams.get('q');
+        }
+    }
+    return {
+        address: valueOf(document.querySelector('button[data-item-id="address"]')),
+        phone: valueOf(document.querySelector('button[data-item-id^="phone:"]')),
+        website: website,
+    };
+}
+"""
+
+# Runs inside the page: scrolls the feed by `step` px and resolves as soon as
+# more than `count` cards exist, the "end of list" marker appears, or the timeout hits.
+SCROLL_AND_WAIT_JS = """
+(feed, { count, step, timeoutMs }) => new Promise((resolve) => {
+    const cards = () => feed.querySelectorAll('div.Nv2PK').length;
+    const ended = () => !!feed.querySelector('span.HlvSq');
+    let done = false;
+    let timer = null;
+    const observer = new MutationObserver(() => {
+        if (cards() > count || ended()) finish(false);
+    });
+    const finish = (timedOut) => {
+        if (done) return;
+        done = true;
+        observer.disconnect();
+        clearTimeout(timer);
+        resolve({ total: cards(), ended: ended(), timedOut: timedOut });
+    };
+    observer.observe(feed, { childList: true, subtree: true });
+    timer = setTimeout(() => finish(true), timeoutMs);
+    feed.scrollTop += step;
+    if (cards() > count || ended()) finish(false);
+})
+"""
+
+class FeedScrollController:
+    """
+    Drives the results feed scroll without fixed sleeps: each step waits on
+    the feed's mutations (new cards or the end-of-list marker) with a timeout,
+    and the scroll step grows or shrinks to aim at `target_per_step` new cards.
+    """
+
+    def __init__(
+        self,
+        feed: Locator,
+        step: int = 2000,
+        min_step: int = 800,
+        max_step: int = 10000,
+        target_per_step: int = 10,
+        timeout_ms: Optional[int] = None,
+        max_stale: int = 2,
+    ):
+        self.feed = feed
+        self.step = step
+        self.min_step = min_step
+        self.max_step = max_step
+        self.target_per_step = target_per_step
+        self.timeout_ms = timeout_ms or int(os.getenv("MAPS_SCROLL_TIMEOUT_MS", "4000"))
+        self.max_stale = max_stale
+        self.stale = 0
+
+    async def advance(self, count: int) -> bool:
+        """Scrolls once; returns False when the feed is exhausted."""
+        state = await self.feed.evaluate(
+            SCROLL_AND_WAIT_JS,
+            {"count": count, "step": self.step, "timeoutMs": self.timeout_ms},
+        )
+        if state["ended"] and state["total"] <= count:
+            print("Reached the end of the results list.")
+            return False
+            
+        new_cards = state["total"] - count
+        if new_cards <= 0:
+            self.stale += 1
+            self.step = self.max_step
+            if self.stale >= self.max_stale:
+                print(f"No new cards after {self.max_stale} scrolls. Breaking.")
+                return False
+        else:
+            self.stale = 0
+            scaled = int(self.step * self.target_per_step / new_cards)
+            self.step = max(self.min_step, min(self.max_step, scaled))
+        return True
 
 class GoogleMapsScraper:
-    def __init__(self, headless: bool = True):
+    def __init__(
+        self,
+        headless: bool = True,
+        pool: Optional[BrowserPool] = None,
+        pacer: Optional[DomainPacer] = None,
+        max_concurrency: Optional[int] = None,
+    ):
         self.headless = headless
+        self.pool = pool or get_browser_pool(headless=headless)
+        self.pacer = pacer or get_domain_pacer()
+        self.max_concurrency = max_concurrency or int(os.getenv("MAPS_MAX_CONCURRENCY", "3"))
+        self.detail_concurrency = int(os.getenv("MAPS_DETAIL_CONCURRENCY", "4"))
+        self.detail_interval = float(os.getenv("MAPS_DETAIL_MIN_INTERVAL", "0.5"))
+        # Blocks tiles, images, fonts and analytics on every Maps page
+        self.request_filter: RequestFilter = maps_filter()
 
-    async def scrape(self, query: str, limit: int = 5) -> List[Lead]:
+    async def scrape(self, query: str, limit: int = 5, index: Optional[LeadIndex] = None) -> List[Lead]:
+        """
+        Scrapes up to `limit` new places for `query` and returns them once the
+        scroll session is over. See iter_leads for the streaming variant.
+        """
         leads: List[Lead] = []
+        async with aclosing(self.iter_leads(query, limit, index)) as stream:
+            async for lead in stream:
+                leads.append(lead)
+        return leads
+
+    async def iter_leads(
+        self,
+        query: str,
+        limit: int = 5,
+        index: Optional[LeadIndex] = None,
+        progress: Optional[Dict[str, int]] = None,
+    ) -> AsyncIterator[Lead]:
+        """
+        Yields up to `limit` new places for `query` as soon as each card is parsed.
+        If a shared `index` is given, places already in it are skipped and
+        newly scraped ones are recorded in it. If `progress` is given, its
+        "cards_seen" entry tracks how many result cards have been loaded.
+        """
+        found = 0
+        seen = index if index is not None else LeadIndex()
         
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=self.headless)
-            context = await browser.new_context(
-                locale="pt-BR",
-                timezone_id="America/Sao_Paulo",
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-            )
-            page = await context.new_page()
-            
+        search_url = MAPS_SEARCH_URL.format(query=query)
+        # Pace before borrowing a tab: queued feeds shouldn't sit on pool slots while they sleep
+        await self.pacer.wait(search_url)
+        async with self.pool.page(self.request_filter) as page:
             try:
                 print(f"Searching for: {query}")
-                await page.goto(f"https://www.google.com/maps/search/{query}", timeout=60000)
+                await page.goto(search_url, timeout=60000)
                 
                 # Check for consent dialog (common in EU, less so in BR but good practice)
                 # await page.get_by_text("Aceitar tudo").click() # Optional
@@ -35,86 +208,148 @@ class GoogleMapsScraper:
                 except:
                     print("Feed not found, taking screenshot")
                     await page.screenshot(path="error_no_feed.png")
-                    return []
+                    return
 
                 # Scroll to load items
                 feed = page.locator(feed_selector)
                 
+                # The first cards may render a moment after the feed container
+                try:
+                    await page.wait_for_selector(f'{feed_selector} div.Nv2PK', timeout=10000)
+                except Exception:
+                    pass
+                
                 print("Scrolling to load results...")
-                previous_count = 0
-                stale_count = 0
-                max_stale = 5  # Break if no new cards after 5 scroll attempts
+                scroller = FeedScrollController(feed)
+                cursor = 0  # Index of the first card not yet harvested
                 
-                while len(leads) < limit:
-                    # selector for cards
-                    card_selector = 'div.Nv2PK' 
-                    
-                    if await feed.locator(card_selector).count() == 0:
-                        await page.wait_for_timeout(2000)
+                while found < limit:
+                    # One round trip returns every card past the cursor
+                    batch = await feed.evaluate(HARVEST_CARDS_JS, cursor)
+                    cursor = batch["total"]
+                    print(f"Found {cursor} cards so far...")
+                    if progress is not None:
+                        progress["cards_seen"] = cursor
                     
-                    cards = await feed.locator(card_selector).all()
-                    current_card_count = len(cards)
-                    
-                    print(f"Found {current_card_count} cards so far...")
-                    
-                    # Stale detection: if same count after scroll, increment stale counter
-                    if current_card_count == previous_count:
-                        stale_count += 1
-                        if stale_count >= max_stale:
-                            print(f"No new cards after {max_stale} scrolls. Breaking.")
-                            break
-                    else:
-                        stale_count = 0
-                    
-                    previous_count = current_card_count
-                    
-                    for card in cards:
-                        if len(leads) >= limit:
+                    for card in batch["cards"]:
+                        if found >= limit:
                             break
                             
                         try:
-                            name_loc = card.locator('.fontHeadlineSmall')
-                            if await name_loc.count() == 0:
+                            name = card["name"]
+                            if not name:
                                 continue
-                            name = await name_loc.first.inner_text()
-                            
-                            # Check if we already have this lead
-                            if any(l.name == name for l in leads):
-                                continue
-
-                            link_loc = card.locator('a.hfpxzc')
-                            source_url = await link_loc.get_attribute('href') if await link_loc.count() > 0 else None
                             
                             lead = Lead(
                                 name=name,
-                                source_url=source_url,
+                                source_url=card["href"],
+                                rating=card["rating"],
+                                category=card["category"],
                                 address=None,
                                 phone=None
                             )
-                            leads.append(lead)
+                            
+                            # Skip places already seen (same place id, or same name + coordinates)
+                            if not seen.add(lead):
+                                continue
+                            
+                            found += 1
                             print(f"  + Scraped: {name}")
+                            yield lead
                             
                         except Exception as e:
                             print(f"Error scraping card: {e}")
                             
-                    if len(leads) >= limit:
+                    if found >= limit:
                         break
                         
-                    # Scroll down
-                    await feed.evaluate("node => node.scrollTop += 2000")
-                    await page.wait_for_timeout(random.uniform(1000, 2000))
+                    # Scroll and wait (event-driven) for new cards or the end of the list
+                    if not await scroller.advance(cursor):
+                        break
                     
             except Exception as e:
                 print(f"Critical error: {e}")
                 await page.screenshot(path="error_critical.png")
-            finally:
-                await browser.close()
+
+    async def scrape_many(
+        self,
+        queries: Iterable[Union[str, Tuple[str, int]]],
+        limit: int = 5,
+        index: Optional[LeadIndex] = None,
+    ) -> Dict[str, List[Lead]]:
+        """
+        Scrapes several queries concurrently, each in its own tab of the shared browser.
+        Accepts plain queries (using `limit`) or (query, limit) tuples.
+        At most `max_concurrency` feeds run at once and navigations are spaced
+        by the domain pacer rather than by fixed sleeps. Passing an `index`
+        also dedups places across queries.
+        """
+        jobs = [(q, limit) if isinstance(q, str) else (q[0], q[1]) for q in queries]
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(query: str, query_limit: int) -> List[Lead]:
+            async with semaphore:
+                try:
+                    return await self.scrape(query, query_limit, index)
+                except Exception as e:
+                    print(f"Error scraping '{query}': {e}")
+                    return []
+
+        results = await asyncio.gather(*(run(q, l) for q, l in jobs))
+        return {query: leads for (query, _), leads in zip(jobs, results)}
+
+    async def scrape_details(self, lead: Lead) -> Lead:
+        """Opens the lead's place page and fills address, phone and website."""
+        if not lead.source_url:
+            return lead
+            
+        # Pace before borrowing a tab so the wait doesn't idle a pool slot other stages need
+        await self.pacer.wait(lead.source_url, interval=self.detail_interval)
+        async with self.pool.page(self.request_filter) as page:
+            try:
+                await page.goto(lead.source_url, timeout=30000)
+                await page.wait_for_selector('h1', timeout=15000)
+                try:
+                    # Info rows render shortly after the title; not every place has them
+                    await page.wait_for_selector(
+                        'button[data-item-id="address"], button[data-item-id^="phone:"], a[data-item-id="authority"]',
+                        timeout=5000
+                    )
+                except Exception:
+                    pass
+                    
+                details = await page.evaluate(PLACE_DETAILS_JS)
+                lead.address = lead.address or details.get("address")
+                lead.phone = lead.phone or details.get("phone")
+                lead.website = lead.website or details.get("website")
+                print(f"  + Details: {lead.name} ({lead.phone or '-'} | {lead.website or '-'})")
                 
-        return leads
+            except Exception as e:
+                print(f"Error fetching details for {lead.name}: {e}")
+                
+        return lead
+
+    async def fetch_details(self, leads: List[Lead], concurrency: Optional[int] = None) -> List[Lead]:
+        """Runs scrape_details over all leads using a bounded number of tabs."""
+        semaphore = asyncio.Semaphore(concurrency or self.detail_concurrency)
+
+        async def run(lead: Lead) -> Lead:
+            async with semaphore:
+                return await self.scrape_details(lead)
+
+        return list(await asyncio.gather(*(run(lead) for lead in leads)))
 
 if __name__ == "__main__":
-    scraper = GoogleMapsScraper(headless=True)
-    # Testing with a small limit
-    results = asyncio.run(scraper.scrape("Marketing Digital São Paulo", limit=3))
+    from app.browser_pool import close_browser_pool
+
+    async def _demo():
+        scraper = GoogleMapsScraper(headless=True)
+        try:
+            # Testing with a small limit
+            return await scraper.scrape("Marketing Digital São Paulo", limit=3)
+        finally:
+            await close_browser_pool()
+
+    results = asyncio.run(_demo())
     for r in results:
         print(f"Result: {r}")
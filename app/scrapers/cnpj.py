@@ -1,25 +1,237 @@
+import os
 import asyncio
-from typing import Optional, Dict
-from duckduckgo_search import DDGS
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, List, Iterable, Tuple, Union
 from playwright.async_api import Page, BrowserContext
+from app.models import Lead
+from app.routing import RequestFilter, cnpj_filter
+from app.browser_pool import BrowserPool
+from app.scrapers.cnpj_cache import CNPJCache
+from app.scrapers.receita import ReceitaIndex
+
+# Field name -> label variants as printed on cnpj.biz
+CNPJ_LABELS = {
+    "cnpj": ["CNPJ:"],
+    "razao_social": ["Razão Social:"],
+    "nome_fantasia": ["Nome Fantasia:"],
+    "capital_social": ["Capital Social:"],
+    "cnae": ["CNAE Principal:", "Atividade Principal:", "CNAE:"],
+    "situacao": ["Situação Cadastral:", "Situação:"],
+    "endereco": ["Endereço:", "Logradouro:"],
+}
+
+# Walks the page once: for each label keeps the smallest element containing it
+# (climbing to the parent when the label sits alone in a <strong>), then reads
+# the partners list that follows the "Sócios" / "Quadro Societário" heading.
+EXTRACT_FIELDS_JS = """
+(labels) => {
+    const best = {};
+    const elements = document.querySelectorAll('p, li, div, td, dd, span, strong, b');
+    for (const el of elements) {
+        const text = el.textContent;
+        if (!text || text.length > 600) continue;
+        for (const [field, variants] of Object.entries(labels)) {
+            for (const label of variants) {
+                if (text.includes(label) && (!best[field] || text.length < best[field].text.length)) {
+                    best[field] = { el: el, label: label, text: text };
+                }
+            }
+        }
+    }
+    const valueAfter = (text, label) => {
+        const rest = text.split(label).slice(1).join(label).trim();
+        return rest.split('\\n')[0].trim().slice(0, 200);
+    };
+    const out = {};
+    for (const [field, found] of Object.entries(best)) {
+        let el = found.el;
+        let value = valueAfter(el.textContent, found.label);
+        for (let depth = 0; !value && el.parentElement && depth < 3; depth++) {
+            el = el.parentElement;
+            value = valueAfter(el.textContent, found.label);
+        }
+        out[field] = value || null;
+    }
+
+    const socios = [];
+    const headings = document.querySelectorAll('h2, h3, h4, strong, b');
+    const heading = Array.from(headings).find(h => /s[óo]cios|quadro societ[áa]rio/i.test(h.textContent));
+    if (heading) {
+        let node = (heading.closest('h2, h3, h4') || heading).nextElementSibling;
+        while (node && !/^H[1-4]$/.test(node.tagName) && socios.length < 20) {
+            const items = node.matches('li, p') ? [node] : node.querySelectorAll('li, p');
+            for (const item of items) {
+                const name = item.textContent.replace(/\\s+/g, ' ').trim();
+                if (name) socios.push(name.slice(0, 200));
+            }
+            node = node.nextElementSibling;
+        }
+    }
+    out.socios = socios;
+
+    const h1 = document.querySelector('h1');
+    out.h1 = h1 ? h1.textContent : '';
+    out.title = document.title;
+    return out;
+}
+"""
 
 class CNPJScraper:
-    def __init__(self):
-        self.ddgs = DDGS()
+    def __init__(
+        self,
+        search_concurrency: Optional[int] = None,
+        page_concurrency: Optional[int] = None,
+        lead_timeout: Optional[float] = None,
+        cache: Optional[CNPJCache] = None,
+        receita: Optional[ReceitaIndex] = None,
+    ):
+        # Pass to BrowserPool.page() so cnpj.biz pages load without images/fonts/ads
+        self.request_filter: RequestFilter = cnpj_filter()
+        # Searches and page scrapes hit different services, so they get separate limits
+        self.search_concurrency = search_concurrency or int(os.getenv("CNPJ_SEARCH_CONCURRENCY", "2"))
+        self.page_concurrency = page_concurrency or int(os.getenv("CNPJ_PAGE_CONCURRENCY", "3"))
+        # Per step (search, page scrape), counted once its slot is held
+        self.lead_timeout = lead_timeout or float(os.getenv("CNPJ_LEAD_TIMEOUT", "45"))
+        self._search_semaphore = asyncio.Semaphore(self.search_concurrency)
+        self._page_semaphore = asyncio.Semaphore(self.page_concurrency)
+        # DDGS is synchronous, so searches run in worker threads (one client per thread)
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("CNPJ_SEARCH_THREADS", str(self.search_concurrency))),
+            thread_name_prefix="ddgs",
+        )
+        self._local = threading.local()
+        if cache is None and os.getenv("CNPJ_CACHE_ENABLED", "1") != "0":
+            cache = CNPJCache()
+        self.cache = cache
+        # Local Receita Federal index (see app/scrapers/receita.py); answers without any network
+        self.receita = receita if receita is not None else ReceitaIndex.from_env()
+        # ReceitaIndex.resolve is blocking SQLite work; keep it off the event loop
+        self._receita_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="receita")
+        self.offline_only = os.getenv("RECEITA_OFFLINE_ONLY", "0") == "1"
+
+    def _ddgs(self):
+        if not hasattr(self._local, "ddgs"):
+            # Imported on first search so offline (Receita) lookups never load it
+            from duckduckgo_search import DDGS
+            self._local.ddgs = DDGS()
+        return self._local.ddgs
+
+    def _search_sync(self, query: str):
+        return self._ddgs().text(query, max_results=1)
+
+    def close(self):
+        """Stops the search thread pool and closes the caches."""
+        self._executor.shutdown(wait=False)
+        self._receita_executor.shutdown(wait=True)
+        if self.receita:
+            self.receita.close()
+        if self.cache:
+            print(f"🗄️ {self.cache.stats()}")
+            self.cache.close()
+
+    @staticmethod
+    def city_from_address(address: Optional[str]) -> str:
+        """Best-effort city from a Maps address (... City, State, Country)."""
+        city = "Brazil"
+        if address and "," in address:
+            parts = address.split(",")
+            if len(parts) >= 2:
+                city = parts[-2].strip()
+        return city
+
+    async def enrich_lead(self, lead: Lead, pool: BrowserPool) -> Lead:
+        """
+        Searches the company on cnpj.biz and fills CNPJ, capital and official name.
+        The search and the page scrape each get `lead_timeout` seconds once they
+        hold their concurrency slot (time spent queued doesn't count); on timeout
+        the lead is left untouched.
+        """
+        city = self.city_from_address(lead.address)
+        if self.receita:
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(self._receita_executor, self.receita.resolve, lead.name, city)
+            if data:
+                return self._apply(lead, data)
+            if self.offline_only:
+                print(f"   ⚠️ CNPJ not found locally for {lead.name}")
+                return lead
+
+        url = await self.search_cnpj_url(lead.name, city)
+        if not url:
+            print(f"   ⚠️ CNPJ not found for {lead.name}")
+            return lead
+            
+        data = self.cache.get_data(url) if self.cache else None
+        if data is None:
+            async with self._page_semaphore:
+                async with pool.page(self.request_filter) as page:
+                    try:
+                        data = await asyncio.wait_for(self.scrape_data(page, url), timeout=self.lead_timeout)
+                    except asyncio.TimeoutError:
+                        print(f"   ⏱️ CNPJ page timed out for {lead.name}")
+                        data = {}
+            if data and self.cache:
+                self.cache.set_data(url, data)
+            
+        if data:
+            self._apply(lead, data)
+        return lead
+
+    @staticmethod
+    def _apply(lead: Lead, data: Dict) -> Lead:
+        print(f"   ✅ Found CNPJ for {lead.name}: {data.get('cnpj')}")
+        lead.cnpj = data.get('cnpj')
+        lead.capital_social = data.get('capital_social')
+        lead.socios = data.get('socios') or lead.socios
+        lead.address = lead.address or data.get('endereco')
+        # Prefer official name if found
+        if data.get('razao_social'):
+            lead.name = data.get('razao_social')
+        return lead
+
+    async def enrich_leads(self, leads: List[Lead], pool: BrowserPool) -> List[Lead]:
+        """Deep-enriches all leads concurrently within the search/page limits."""
+        return list(await asyncio.gather(*(self.enrich_lead(lead, pool) for lead in leads)))
 
     async def search_cnpj_url(self, company_name: str, city: str) -> Optional[str]:
-        """Finds the best CNPJ.biz URL for the company"""
+        """
+        Finds the best CNPJ.biz URL for the company.
+        Answers (including "not found") are cached; search errors are not.
+        """
+        if self.cache:
+            hit, url = self.cache.get_url(company_name, city)
+            if hit:
+                return url
+                
         query = f"site:cnpj.biz {company_name} {city}"
         print(f"   🔍 Searching CNPJ for: {query}")
         
         try:
-            results = self.ddgs.text(query, max_results=1)
-            if results:
-                return results[0]['href']
+            async with self._search_semaphore:
+                loop = asyncio.get_running_loop()
+                results = await asyncio.wait_for(
+                    loop.run_in_executor(self._executor, self._search_sync, query),
+                    timeout=self.lead_timeout,
+                )
+            url = results[0]['href'] if results else None
+            if self.cache:
+                self.cache.set_url(company_name, city, url)
+            return url
+        except asyncio.TimeoutError:
+            print(f"   ⏱️ CNPJ search timed out for {company_name}")
         except Exception as e:
             print(f"   ❌ Search Error: {e}")
         return None
 
+    async def search_many(self, companies: Iterable[Union[str, Tuple[str, str]]], city: str = "Brazil") -> List[Optional[str]]:
+        """
+        Resolves many cnpj.biz URLs concurrently (bounded by the search limit).
+        Accepts names (searched in `city`) or (name, city) tuples; results keep input order.
+        """
+        jobs = [(c, city) if isinstance(c, str) else c for c in companies]
+        return list(await asyncio.gather(*(self.search_cnpj_url(name, job_city) for name, job_city in jobs)))
+
     async def scrape_data(self, page: Page, url: str) -> Dict:
         """Extracts data from CNPJ.biz page"""
         print(f"   🌐 Opening: {url}")
@@ -27,30 +239,23 @@ class CNPJScraper:
             await page.goto(url, timeout=30000)
             await page.wait_for_load_state("domcontentloaded")
             
-            # Extract basic data using reliable selectors or text search
+            # Extract every known label in a single pass over the DOM
             # CNPJ.biz structure is usually simple lists
-            
-            data = {}
-            
-            # 1. CNPJ & Razao Social (Usually in H1 or H2)
-            # Standard: "Empresa Razao Social (CNPJ: 00.000...)"
-            title = await page.title()
-            data['meta_title'] = title
-            
-            # 2. Extract specific fields by looking for strong tags
             # Example: <strong>Capital Social:</strong> R$ 10.000,00
+            fields = await page.evaluate(EXTRACT_FIELDS_JS, CNPJ_LABELS)
             
-            # Helper to get text by label
-            async def get_by_label(label: str):
-                return await page.evaluate(f'''(label) => {{
-                    const elements = Array.from(document.querySelectorAll('p, li, div'));
-                    const found = elements.find(el => el.textContent.includes(label));
-                    return found ? found.textContent.split(label)[1].trim() : null;
-                }}''', label)
-
-            data['cnpj'] = await get_by_label("CNPJ:")
-            data['capital_social'] = await get_by_label("Capital Social:")
-            data['razao_social'] = await page.evaluate("document.querySelector('h1') ? document.querySelector('h1').textContent : ''")
+            data = {
+                'meta_title': fields.get('title'),
+                'cnpj': fields.get('cnpj'),
+                'capital_social': fields.get('capital_social'),
+                # Razao Social: explicit label first, H1 as fallback
+                'razao_social': fields.get('razao_social') or (fields.get('h1') or '').strip(),
+                'nome_fantasia': fields.get('nome_fantasia'),
+                'cnae': fields.get('cnae'),
+                'situacao': fields.get('situacao'),
+                'endereco': fields.get('endereco'),
+                'socios': fields.get('socios') or [],
+            }
             
             # Cleaning
             if data['cnpj']:
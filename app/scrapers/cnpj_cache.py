@@ -0,0 +1,126 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from typing import Optional, Dict, Tuple
+from app.dedup import normalize_name
+
+CNPJ_DIGITS_RE = re.compile(r"(\d{14})")
+
+
+def cnpj_from_url(url: str) -> Optional[str]:
+    """cnpj.biz URLs end with the 14 CNPJ digits."""
+    match = CNPJ_DIGITS_RE.search(url or "")
+    return match.group(1) if match else None
+
+
+class CNPJCache:
+    """
+    Local SQLite cache for deep enrichment:
+    - normalized (name, city) -> cnpj.biz URL, including "not found" answers
+      (negative entries expire sooner, after `negative_ttl_seconds`);
+    - CNPJ -> scraped firmographics.
+    Both are consulted before any search or navigation.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        ttl_seconds: Optional[float] = None,
+        negative_ttl_seconds: Optional[float] = None,
+    ):
+        self.path = path or os.getenv("CNPJ_CACHE_PATH", os.path.join(".cache", "cnpj_cache.sqlite3"))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("CNPJ_CACHE_TTL_DAYS", "90")) * 86400
+        self.negative_ttl_seconds = (
+            negative_ttl_seconds if negative_ttl_seconds is not None
+            else float(os.getenv("CNPJ_CACHE_NEGATIVE_TTL_DAYS", "7")) * 86400
+        )
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS cnpj_urls (
+                key TEXT PRIMARY KEY,
+                url TEXT,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS cnpj_data (
+                key TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            """
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _company_key(name: str, city: str) -> str:
+        return f"{normalize_name(name)}|{normalize_name(city)}"
+
+    @staticmethod
+    def _data_key(url: str) -> str:
+        return cnpj_from_url(url) or url
+
+    def _record(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def get_url(self, name: str, city: str) -> Tuple[bool, Optional[str]]:
+        """Returns (hit, url); a hit with url None means "known not found"."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url, created_at FROM cnpj_urls WHERE key = ?", (self._company_key(name, city),)
+            ).fetchone()
+        if row is not None:
+            ttl = self.ttl_seconds if row[0] else self.negative_ttl_seconds
+            if time.time() - row[1] <= ttl:
+                self._record(True)
+                return True, row[0]
+        self._record(False)
+        return False, None
+
+    def set_url(self, name: str, city: str, url: Optional[str]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cnpj_urls (key, url, created_at) VALUES (?, ?, ?)",
+                (self._company_key(name, city), url, time.time()),
+            )
+            self._conn.commit()
+
+    def get_data(self, url: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, created_at FROM cnpj_data WHERE key = ?", (self._data_key(url),)
+            ).fetchone()
+        if row is not None and time.time() - row[1] <= self.ttl_seconds:
+            self._record(True)
+            return json.loads(row[0])
+        self._record(False)
+        return None
+
+    def set_data(self, url: str, data: Dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cnpj_data (key, data, created_at) VALUES (?, ?, ?)",
+                (self._data_key(url), json.dumps(data, ensure_ascii=False), time.time()),
+            )
+            self._conn.commit()
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        ratio = (self.hits / total * 100) if total else 0.0
+        return f"CNPJ cache: {self.hits} hits / {self.misses} misses ({ratio:.0f}% hit rate)"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
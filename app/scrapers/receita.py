@@ -0,0 +1,423 @@
+"""
+Offline CNPJ resolver backed by the Receita Federal open-data dump
+(https://dados.gov.br/dados/conjuntos-dados/cadastro-nacional-da-pessoa-juridica---cnpj).
+
+The loader streams the zipped CSVs straight into SQLite (no file is ever held
+in memory) and builds one FTS5 name index per UF, with the município code as an
+indexed column, so matching a Maps lead becomes a local query over that city's
+companies instead of a search + page scrape.
+
+    python -m app.scrapers.receita --dir dados_receita/ --ufs SP
+"""
+import os
+import io
+import csv
+import glob
+import sqlite3
+import zipfile
+import argparse
+import threading
+from difflib import SequenceMatcher
+from typing import Optional, Dict, Iterable, Iterator, List, Tuple
+from app.dedup import normalize_name
+
+# Column positions in the (headerless, ';'-separated, latin-1) Receita files
+EST_CNPJ_BASICO, EST_ORDEM, EST_DV = 0, 1, 2
+EST_NOME_FANTASIA, EST_SITUACAO = 4, 5
+EST_CNAE = 11
+EST_TIPO_LOGRADOURO, EST_LOGRADOURO, EST_NUMERO, EST_COMPLEMENTO, EST_BAIRRO, EST_CEP = 13, 14, 15, 16, 17, 18
+EST_UF, EST_MUNICIPIO = 19, 20
+EST_DDD, EST_TELEFONE = 21, 22
+
+EMP_CNPJ_BASICO, EMP_RAZAO_SOCIAL, EMP_CAPITAL_SOCIAL = 0, 1, 4
+SOC_CNPJ_BASICO, SOC_NOME = 0, 2
+
+SITUACOES = {"01": "NULA", "02": "ATIVA", "03": "SUSPENSA", "04": "INAPTA", "08": "BAIXADA"}
+
+# Substrings identifying each file family (old "K3241.K03200Y0.D40113.ESTABELE" and new "Estabelecimentos0.zip" names)
+FILE_PATTERNS = {
+    "municipios": "munic",
+    "estabelecimentos": "estabele",
+    "empresas": "empre",
+    "socios": "socio",
+}
+
+# Words too common in business names to help a full-text match
+NAME_STOPWORDS = {"ltda", "eireli", "epp", "me", "s a", "sa", "comercio", "de", "da", "do", "dos", "das", "e"}
+
+# Where the CLI builds the index unless RECEITA_DB_PATH / --db say otherwise
+DEFAULT_DB_PATH = os.path.join(".cache", "receita.sqlite3")
+
+BATCH_SIZE = 50_000
+MIN_MATCH_SCORE = 0.6
+# Name matches scored per lookup. Not ordered by FTS rank: bm25 reads every matching
+# posting list in full (the município term covers the whole city), which costs far more
+# than scoring a few hundred candidates with SequenceMatcher.
+MAX_CANDIDATES = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS municipios (
+    codigo TEXT PRIMARY KEY,
+    nome TEXT,
+    nome_norm TEXT,
+    uf TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_municipios_nome ON municipios (nome_norm);
+
+CREATE TABLE IF NOT EXISTS estabelecimentos (
+    cnpj TEXT PRIMARY KEY,
+    cnpj_basico TEXT NOT NULL,
+    nome_fantasia TEXT,
+    situacao TEXT,
+    cnae TEXT,
+    endereco TEXT,
+    telefone TEXT,
+    uf TEXT,
+    municipio TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_estab_basico ON estabelecimentos (cnpj_basico);
+CREATE INDEX IF NOT EXISTS idx_estab_local ON estabelecimentos (uf, municipio);
+
+CREATE TABLE IF NOT EXISTS empresas (
+    cnpj_basico TEXT PRIMARY KEY,
+    razao_social TEXT,
+    capital_social TEXT
+);
+
+CREATE TABLE IF NOT EXISTS socios (
+    cnpj_basico TEXT NOT NULL,
+    nome TEXT
+);
+"""
+
+
+def _iter_zip_rows(path: str) -> Iterator[List[str]]:
+    """Streams the CSV rows of every member of a Receita zip file."""
+    with zipfile.ZipFile(path) as archive:
+        for member in archive.namelist():
+            with archive.open(member) as raw:
+                text = io.TextIOWrapper(raw, encoding="latin-1", newline="")
+                yield from csv.reader(text, delimiter=";", quotechar='"')
+
+
+def _batched(rows: Iterable, size: int = BATCH_SIZE) -> Iterator[list]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ReceitaIndex:
+    """Local SQLite copy of the Receita CNPJ data with an FTS5 name index."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("RECEITA_DB_PATH", DEFAULT_DB_PATH)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Lookups run in executor threads; the connection is shared
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.create_function("normalize_name", 1, normalize_name, deterministic=True)
+        self._tables = self._name_tables()
+        # nome_norm -> [(codigo, uf)], loaded on the first lookup
+        self._cities: Optional[Dict[str, List[Tuple[str, str]]]] = None
+
+    @classmethod
+    def from_env(cls) -> Optional["ReceitaIndex"]:
+        """Opens the index at RECEITA_DB_PATH (or the CLI's default path) if it has been built."""
+        path = os.getenv("RECEITA_DB_PATH") or DEFAULT_DB_PATH
+        if not os.path.exists(path):
+            return None
+        index = cls(path)
+        if index.is_ready():
+            return index
+        if index._conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'names_fts'").fetchone():
+            print(f"⚠️ {path} has an old single-table name index; rebuild it with python -m app.scrapers.receita")
+        index.close()
+        return None
+
+    def _migrate(self):
+        """Brings indexes built by older versions up to the current schema."""
+        columns = {r[1] for r in self._conn.execute("PRAGMA table_info(municipios)")}
+        if "uf" not in columns:
+            self._conn.execute("ALTER TABLE municipios ADD COLUMN uf TEXT")
+        if not self._conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'uq_socios'").fetchone():
+            # Earlier loads appended partners on every run
+            self._conn.execute(
+                "DELETE FROM socios WHERE rowid NOT IN (SELECT MIN(rowid) FROM socios GROUP BY cnpj_basico, nome)"
+            )
+            self._conn.execute("CREATE UNIQUE INDEX uq_socios ON socios (cnpj_basico, nome)")
+        self._conn.commit()
+
+    def is_ready(self) -> bool:
+        return bool(self._tables)
+
+    def _name_tables(self) -> Dict[str, str]:
+        """UF -> its FTS table (names_fts_sp, ...); the GLOB skips FTS5 shadow tables."""
+        rows = self._conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'names_fts_[a-z][a-z]'"
+        ).fetchall()
+        return {name[-2:].upper(): name for (name,) in rows}
+
+    # Loading
+
+    def _find_files(self, directory: str, family: str) -> List[str]:
+        pattern = FILE_PATTERNS[family]
+        return sorted(p for p in glob.glob(os.path.join(directory, "*.zip")) if pattern in os.path.basename(p).lower())
+
+    def load_municipios(self, paths: Iterable[str]):
+        rows = ((r[0], r[1], normalize_name(r[1])) for path in paths for r in _iter_zip_rows(path) if len(r) >= 2)
+        for batch in _batched(rows):
+            self._conn.executemany("INSERT OR REPLACE INTO municipios (codigo, nome, nome_norm) VALUES (?, ?, ?)", batch)
+        self._conn.commit()
+
+    def load_estabelecimentos(self, paths: Iterable[str], ufs: Optional[Iterable[str]] = None, active_only: bool = True) -> int:
+        wanted_ufs = {uf.upper() for uf in ufs} if ufs else None
+
+        def rows():
+            for path in paths:
+                print(f"📥 Loading {os.path.basename(path)}...")
+                for r in _iter_zip_rows(path):
+                    if len(r) <= EST_TELEFONE:
+                        continue
+                    if wanted_ufs and r[EST_UF] not in wanted_ufs:
+                        continue
+                    if active_only and r[EST_SITUACAO] != "02":
+                        continue
+                    endereco = " ".join(
+                        part for part in (r[EST_TIPO_LOGRADOURO], r[EST_LOGRADOURO], r[EST_NUMERO], r[EST_COMPLEMENTO]) if part
+                    )
+                    if r[EST_BAIRRO]:
+                        endereco += f" - {r[EST_BAIRRO]}"
+                    if r[EST_CEP]:
+                        endereco += f", {r[EST_CEP]}"
+                    telefone = f"({r[EST_DDD]}) {r[EST_TELEFONE]}" if r[EST_TELEFONE] else None
+                    yield (
+                        r[EST_CNPJ_BASICO] + r[EST_ORDEM] + r[EST_DV],
+                        r[EST_CNPJ_BASICO],
+                        r[EST_NOME_FANTASIA] or None,
+                        SITUACOES.get(r[EST_SITUACAO], r[EST_SITUACAO]),
+                        r[EST_CNAE],
+                        endereco,
+                        telefone,
+                        r[EST_UF],
+                        r[EST_MUNICIPIO],
+                    )
+
+        total = 0
+        for batch in _batched(rows()):
+            self._conn.executemany("INSERT OR REPLACE INTO estabelecimentos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+            self._conn.commit()
+            total += len(batch)
+        return total
+
+    def load_empresas(self, paths: Iterable[str]) -> int:
+        """Loads razão social / capital only for companies with a loaded estabelecimento."""
+        rows = (
+            (r[EMP_CNPJ_BASICO], r[EMP_RAZAO_SOCIAL], r[EMP_CAPITAL_SOCIAL], r[EMP_CNPJ_BASICO])
+            for path in paths for r in _iter_zip_rows(path) if len(r) > EMP_CAPITAL_SOCIAL
+        )
+        total = 0
+        for batch in _batched(rows):
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO empresas SELECT ?, ?, ? "
+                "WHERE EXISTS (SELECT 1 FROM estabelecimentos WHERE cnpj_basico = ?)",
+                batch,
+            )
+            self._conn.commit()
+            total += len(batch)
+        return total
+
+    def load_socios(self, paths: Iterable[str]) -> int:
+        rows = (
+            (r[SOC_CNPJ_BASICO], r[SOC_NOME], r[SOC_CNPJ_BASICO])
+            for path in paths for r in _iter_zip_rows(path) if len(r) > SOC_NOME
+        )
+        total = 0
+        for batch in _batched(rows):
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO socios SELECT ?, ? WHERE EXISTS (SELECT 1 FROM empresas WHERE cnpj_basico = ?)",
+                batch,
+            )
+            self._conn.commit()
+            total += len(batch)
+        return total
+
+    def _create_name_table(self, table: str):
+        try:
+            # Trigram matching tolerates partial words ("panif" ~ "panificadora"); needs SQLite >= 3.34
+            self._conn.execute(
+                f"CREATE VIRTUAL TABLE {table} USING fts5("
+                "fantasia, razao, municipio, cnpj UNINDEXED, tokenize='trigram')"
+            )
+        except sqlite3.OperationalError:
+            self._conn.execute(
+                f"CREATE VIRTUAL TABLE {table} USING fts5("
+                "fantasia, razao, municipio, cnpj UNINDEXED, tokenize='unicode61 remove_diacritics 2')"
+            )
+
+    def build_name_index(self):
+        """
+        (Re)builds the FTS5 indexes over normalized fantasia + razão social names:
+        one table per UF, with the município code indexed so a lookup only ranks
+        matches in that city. Also records each município's UF.
+        """
+        locations = self._conn.execute("SELECT DISTINCT uf, municipio FROM estabelecimentos").fetchall()
+        self._conn.executemany("UPDATE municipios SET uf = ? WHERE codigo = ?", locations)
+
+        for table in self._name_tables().values():
+            self._conn.execute(f"DROP TABLE {table}")
+        self._conn.execute("DROP TABLE IF EXISTS names_fts")  # single-table index from older builds
+        for uf in sorted({uf for uf, _ in locations if uf and len(uf) == 2 and uf.isalpha()}):
+            table = f"names_fts_{uf.lower()}"
+            self._create_name_table(table)
+            self._conn.execute(
+                f"""
+                INSERT INTO {table} (fantasia, razao, municipio, cnpj)
+                SELECT normalize_name(COALESCE(e.nome_fantasia, '')), normalize_name(COALESCE(m.razao_social, '')),
+                       e.municipio, e.cnpj
+                FROM estabelecimentos e
+                LEFT JOIN empresas m ON m.cnpj_basico = e.cnpj_basico
+                WHERE e.uf = ?
+                """,
+                (uf,),
+            )
+        self._conn.commit()
+        self._tables = self._name_tables()
+        self._cities = None
+
+    def load_directory(self, directory: str, ufs: Optional[Iterable[str]] = None, active_only: bool = True):
+        """Loads every Receita zip found in `directory` and builds the name index."""
+        self.load_municipios(self._find_files(directory, "municipios"))
+        count = self.load_estabelecimentos(self._find_files(directory, "estabelecimentos"), ufs, active_only)
+        print(f"✅ {count} estabelecimentos loaded")
+        self.load_empresas(self._find_files(directory, "empresas"))
+        self.load_socios(self._find_files(directory, "socios"))
+        print("🔎 Building name index...")
+        self.build_name_index()
+        print("✅ Receita index ready")
+
+    # Lookup
+
+    def _municipios(self, city: str) -> List[Tuple[str, str]]:
+        """(codigo, uf) of the loaded municípios named `city`."""
+        if self._cities is None:
+            cities: Dict[str, List[Tuple[str, str]]] = {}
+            with self._lock:
+                rows = self._conn.execute("SELECT nome_norm, codigo, uf FROM municipios WHERE uf IS NOT NULL").fetchall()
+            for nome_norm, codigo, uf in rows:
+                cities.setdefault(nome_norm, []).append((codigo, uf))
+            self._cities = cities
+        return self._cities.get(normalize_name(city), [])
+
+    def _search(self, uf: str, names: str, codes: List[str]) -> List[Tuple[str, str, str]]:
+        """Name matches in one UF's table, restricted to `codes` when given."""
+        table = self._tables.get(uf)
+        if table is None:
+            return []
+        match = f"{{fantasia razao}} : ({names})"
+        if codes:
+            match += " AND municipio : (" + " OR ".join(f'"{c}"' for c in codes) + ")"
+        try:
+            with self._lock:
+                return self._conn.execute(
+                    f"SELECT fantasia, razao, cnpj FROM {table} WHERE {table} MATCH ? LIMIT ?",
+                    (match, MAX_CANDIDATES),
+                ).fetchall()
+        except sqlite3.OperationalError:
+            return []
+
+    def resolve(self, name: str, city: Optional[str] = None, uf: Optional[str] = None) -> Optional[Dict]:
+        """
+        Best local match for a business name (optionally restricted to a city).
+        Returns the same keys as CNPJScraper.scrape_data, or None below MIN_MATCH_SCORE.
+        Blocking (SQLite); call it from a worker thread on the event loop.
+        """
+        if city and uf is None:
+            # Maps addresses end in "... São Paulo - SP, 01310-100"
+            city, _, suffix = city.partition(" - ")
+            uf = suffix.strip()[:2] or None
+        uf = uf.upper() if uf else None
+        norm = normalize_name(name)
+        tokens = [t for t in norm.split() if len(t) >= 3 and t not in NAME_STOPWORDS]
+        if not tokens:
+            return None
+        names = " AND ".join(f'"{t}"' for t in tokens)
+
+        # UF -> município codes to search; a known UF narrows homonymous cities
+        by_uf: Dict[str, List[str]] = {}
+        for codigo, code_uf in self._municipios(city) if city else []:
+            by_uf.setdefault(code_uf, []).append(codigo)
+        if uf in by_uf:
+            by_uf = {uf: by_uf[uf]}
+        elif not by_uf:
+            # Unknown city: match on the name alone within the UF (or every UF)
+            by_uf = {u: [] for u in ([uf] if uf in self._tables else self._tables)}
+
+        candidates = [row for u, codes in by_uf.items() for row in self._search(u, names, codes)]
+
+        best_cnpj, best_score = None, 0.0
+        for fantasia, razao, cnpj in candidates:
+            score = max(
+                SequenceMatcher(None, norm, fantasia).ratio() if fantasia else 0.0,
+                SequenceMatcher(None, norm, razao).ratio() if razao else 0.0,
+            )
+            if score > best_score:
+                best_cnpj, best_score = cnpj, score
+        if best_cnpj is None or best_score < MIN_MATCH_SCORE:
+            return None
+        return self.get(best_cnpj)
+
+    def get(self, cnpj: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                """
+                SELECT e.cnpj, e.cnpj_basico, e.nome_fantasia, e.situacao, e.cnae, e.endereco, e.telefone,
+                       m.razao_social, m.capital_social, mu.nome, e.uf
+                FROM estabelecimentos e
+                LEFT JOIN empresas m ON m.cnpj_basico = e.cnpj_basico
+                LEFT JOIN municipios mu ON mu.codigo = e.municipio
+                WHERE e.cnpj = ?
+                """,
+                (cnpj,),
+            ).fetchone()
+            if row is None:
+                return None
+            socios = [r[0] for r in self._conn.execute("SELECT nome FROM socios WHERE cnpj_basico = ?", (row[1],))]
+        endereco = row[5]
+        if row[9]:
+            endereco = f"{endereco}, {row[9].title()} - {row[10]}"
+        return {
+            "cnpj": row[0],
+            "razao_social": row[7],
+            "nome_fantasia": row[2],
+            "capital_social": row[8],
+            "cnae": row[4],
+            "situacao": row[3],
+            "endereco": endereco,
+            "telefone": row[6],
+            "socios": socios,
+        }
+
+    def close(self):
+        self._conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the local Receita Federal CNPJ index")
+    parser.add_argument("--dir", required=True, help="Directory with the downloaded Receita .zip files")
+    parser.add_argument("--ufs", nargs="*", help="Only load these UFs (e.g. SP RJ)")
+    parser.add_argument("--all-situacoes", action="store_true", help="Also load inactive (baixada, inapta...) companies")
+    parser.add_argument("--db", help="Output SQLite path (default: RECEITA_DB_PATH or .cache/receita.sqlite3)")
+    args = parser.parse_args()
+
+    index = ReceitaIndex(args.db)
+    index.load_directory(args.dir, args.ufs, active_only=not args.all_situacoes)
+    index.close()
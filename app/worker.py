@@ -0,0 +1,247 @@
+"""
+Scrape job workers.
+
+Each worker process polls the scrape_jobs table, claims jobs with
+SELECT ... FOR UPDATE SKIP LOCKED and runs them with its own browser pool,
+so bursts of /scrape requests queue up instead of all launching Chromium
+in the web process.
+
+    python -m app.worker --workers 3 --browser-concurrency 3 --job-concurrency 2
+
+Every running job keeps one browser context for its Maps feed, so each
+process needs more browser contexts than concurrent jobs. The parent
+process restarts workers that die and, on SIGTERM/Ctrl+C, stops them;
+a worker that is stopped puts its running jobs back in the queue.
+Running jobs hold a lease renewed by their worker's heartbeat; any worker
+requeues jobs whose lease expired, so jobs of crashed or vanished workers
+(new hostname after a redeploy, fewer --workers) don't stay "running".
+"""
+import os
+import time
+import signal
+import socket
+import asyncio
+import argparse
+import multiprocessing
+from typing import Optional, Dict
+from app import database
+from app.jobs import claim_job, update_progress, finish_job, fail_job, heartbeat, requeue_stale, release_jobs
+
+
+class JobWorker:
+    def __init__(self, worker_id: str, concurrency: Optional[int] = None, poll_interval: Optional[float] = None):
+        self.worker_id = worker_id
+        # Jobs run at once in this process; they share its browser pool
+        self.concurrency = concurrency or int(os.getenv("WORKER_JOB_CONCURRENCY", "1"))
+        self.poll_interval = poll_interval or float(os.getenv("WORKER_POLL_INTERVAL", "2"))
+        self.heartbeat_interval = float(os.getenv("WORKER_HEARTBEAT_INTERVAL", "10"))
+        self.lease_seconds = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+        if self.lease_seconds <= 2 * self.heartbeat_interval:
+            raise ValueError(
+                f"JOB_LEASE_SECONDS ({self.lease_seconds}) must be more than twice "
+                f"WORKER_HEARTBEAT_INTERVAL ({self.heartbeat_interval})"
+            )
+        self._slots = asyncio.Semaphore(self.concurrency)
+        # job_id -> task running it
+        self._running: Dict[int, asyncio.Task] = {}
+
+    async def _db(self, fn, *args):
+        """Runs a sync app.jobs helper on its own short-lived session."""
+        db = database.AsyncSessionLocal()
+        try:
+            return await db.run_sync(fn, *args)
+        finally:
+            await db.close()
+
+    async def _claim(self):
+        return await self._db(claim_job, self.worker_id)
+
+    async def _execute(self, job):
+        # Imported here so the parent process never loads playwright/langchain
+        from app.services import process_lead_generation
+
+        print(f"🛠️ [{self.worker_id}] Job {job.job_id}: '{job.termo_busca}'")
+        try:
+            # Each write gets a fresh session: a failed progress write must not poison finish_job
+            async def report(progress):
+                await self._db(update_progress, job.job_id, progress)
+
+            result = await process_lead_generation(
+                job.termo_busca, job.limite, job.segmento_mercado, job.no_enrich, job.deep_enrich,
+                on_progress=report,
+            )
+            await self._db(finish_job, job.job_id, result)
+        except Exception as e:
+            print(f"❌ [{self.worker_id}] Job {job.job_id} failed: {e}")
+            await self._db(fail_job, job.job_id, e)
+        finally:
+            self._slots.release()
+
+    async def _heartbeat(self):
+        """Renews the lease on this worker's jobs and requeues other workers' expired ones."""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            db = database.AsyncSessionLocal()
+            try:
+                await db.run_sync(heartbeat, self.worker_id, list(self._running))
+                await db.run_sync(requeue_stale, self.lease_seconds)
+            except Exception as e:
+                print(f"⚠️ [{self.worker_id}] Heartbeat failed: {e}")
+            finally:
+                await db.close()
+
+    async def _release(self, job_ids):
+        db = database.AsyncSessionLocal()
+        try:
+            released = await db.run_sync(release_jobs, self.worker_id, job_ids)
+            if released:
+                print(f"♻️ [{self.worker_id}] Requeued {released} interrupted job(s)")
+        except Exception as e:
+            print(f"⚠️ [{self.worker_id}] Could not requeue interrupted jobs (their lease will expire): {e}")
+        finally:
+            await db.close()
+
+    def _check_pool(self):
+        from app.browser_pool import get_browser_pool
+
+        # Each job's feed holds a context for the whole scroll session
+        pool_size = get_browser_pool().size
+        if pool_size <= self.concurrency:
+            raise ValueError(
+                f"Browser pool size ({pool_size}) must be greater than job concurrency ({self.concurrency})"
+            )
+
+    async def run(self):
+        self._check_pool()
+        print(f"👷 [{self.worker_id}] Waiting for jobs (concurrency {self.concurrency})")
+        beat = asyncio.create_task(self._heartbeat())
+        try:
+            while True:
+                await self._slots.acquire()
+                try:
+                    job = await self._claim()
+                except Exception as e:
+                    print(f"⚠️ [{self.worker_id}] Could not poll jobs: {e}")
+                    job = None
+                if job is None:
+                    self._slots.release()
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                task = asyncio.create_task(self._execute(job))
+                self._running[job.job_id] = task
+                task.add_done_callback(lambda _, job_id=job.job_id: self._running.pop(job_id, None))
+        finally:
+            from app.browser_pool import close_browser_pool
+
+            beat.cancel()
+            interrupted = list(self._running)
+            for task in self._running.values():
+                task.cancel()
+            await asyncio.gather(beat, *self._running.values(), return_exceptions=True)
+            await self._release(interrupted)
+            await close_browser_pool()
+
+
+async def _serve(worker: JobWorker):
+    main_task = asyncio.current_task()
+
+    def stop():
+        # Only once: a second cancel would interrupt the shutdown (requeue, browser close)
+        loop.remove_signal_handler(signal.SIGTERM)
+        main_task.cancel()
+
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, stop)
+    await worker.run()
+
+
+def _run_worker(worker_id: str, browser_concurrency: Optional[int], job_concurrency: Optional[int]):
+    if browser_concurrency:
+        # Read by BrowserPool when this process creates its pool
+        os.environ["BROWSER_POOL_SIZE"] = str(browser_concurrency)
+    try:
+        asyncio.run(_serve(JobWorker(worker_id, concurrency=job_concurrency)))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+
+def _start_worker(worker_id: str, browser_concurrency: int, job_concurrency: int) -> multiprocessing.Process:
+    process = multiprocessing.Process(
+        target=_run_worker, args=(worker_id, browser_concurrency, job_concurrency), name=worker_id
+    )
+    process.start()
+    return process
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Scrape job workers")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WORKER_PROCESSES", "2")), help="Worker processes")
+    parser.add_argument(
+        "--browser-concurrency",
+        type=int,
+        default=int(os.getenv("WORKER_BROWSER_CONCURRENCY", "2")),
+        help="Browser contexts per worker process",
+    )
+    parser.add_argument(
+        "--job-concurrency",
+        type=int,
+        default=int(os.getenv("WORKER_JOB_CONCURRENCY", "1")),
+        help="Jobs run at once per worker process",
+    )
+    parser.add_argument(
+        "--restart-delay",
+        type=float,
+        default=float(os.getenv("WORKER_RESTART_DELAY", "5")),
+        help="Seconds between supervisor checks for dead workers",
+    )
+    parser.add_argument(
+        "--shutdown-timeout",
+        type=float,
+        default=float(os.getenv("WORKER_SHUTDOWN_TIMEOUT", "30")),
+        help="Seconds a stopping worker gets to requeue its jobs before it is killed",
+    )
+    args = parser.parse_args()
+    if args.browser_concurrency <= args.job_concurrency:
+        parser.error("--browser-concurrency must be greater than --job-concurrency "
+                     "(each running job holds a browser context for its Maps feed)")
+
+    def terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    # docker stop / systemd only signal this process; the finally below stops the workers
+    signal.signal(signal.SIGTERM, terminate)
+
+    # Ids are host + slot; recovery doesn't depend on them (see JOB_LEASE_SECONDS)
+    host = socket.gethostname()
+    processes = {
+        worker_id: _start_worker(worker_id, args.browser_concurrency, args.job_concurrency)
+        for worker_id in (f"{host}-w{i}" for i in range(args.workers))
+    }
+    try:
+        while True:
+            time.sleep(args.restart_delay)
+            for worker_id, process in list(processes.items()):
+                if process.is_alive():
+                    continue
+                print(f"💀 [{worker_id}] Exited with code {process.exitcode}, restarting")
+                processes[worker_id] = _start_worker(worker_id, args.browser_concurrency, args.job_concurrency)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + args.shutdown_timeout
+        for worker_id, process in processes.items():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                print(f"💀 [{worker_id}] Did not stop in time, killing")
+                process.kill()
+                process.join()
+
+
+if __name__ == "__main__":
+    main()
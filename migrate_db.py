@@ -0,0 +1,129 @@
+"""
+Database Migration Tool
+Brings existing databases up to the current dedup schema:
+- empresas.nome_normalizado + per-segment unique index (company dedup);
+- contatos.chave_contato + (empresa_id, chave_contato) unique index (contact dedup);
+- the scrape_jobs queue table used by the API and app.worker.
+Safe to re-run.
+"""
+from sqlalchemy import text
+from app.database import engine
+from app.dedup import normalize_name, contact_key
+from app.schema import ScrapeJob
+
+BACKFILL_BATCH = 1000
+
+
+def add_normalized_name():
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE empresas ADD COLUMN IF NOT EXISTS nome_normalizado VARCHAR(255)"))
+
+
+def backfill_normalized_name():
+    """Fills nome_normalizado in batches; later duplicates within a segment stay NULL."""
+    seen = set()
+    with engine.begin() as conn:
+        for segment, key in conn.execute(text(
+            "SELECT segmento_mercado, nome_normalizado FROM empresas WHERE nome_normalizado IS NOT NULL"
+        )):
+            seen.add((segment, key))
+
+    total = duplicates = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT empresa_id, razao_social, segmento_mercado FROM empresas "
+                "WHERE nome_normalizado IS NULL AND empresa_id > :last_id "
+                "ORDER BY empresa_id LIMIT :limit"
+            ), {"last_id": last_id, "limit": BACKFILL_BATCH}).all()
+            if not rows:
+                break
+            updates = []
+            for empresa_id, razao_social, segment in rows:
+                key = normalize_name(razao_social)
+                if (segment, key) in seen:
+                    duplicates += 1
+                    continue
+                seen.add((segment, key))
+                updates.append({"id": empresa_id, "key": key})
+            if updates:
+                conn.execute(text("UPDATE empresas SET nome_normalizado = :key WHERE empresa_id = :id"), updates)
+            total += len(updates)
+            last_id = rows[-1][0]
+
+    print(f"✅ Backfilled {total} companies ({duplicates} duplicates left without a key)")
+
+
+def create_normalized_name_index():
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_empresas_segmento_nome "
+            "ON empresas (segmento_mercado, nome_normalizado)"
+        ))
+
+
+def add_contact_key():
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE contatos ADD COLUMN IF NOT EXISTS chave_contato VARCHAR(255)"))
+
+
+def backfill_contact_key():
+    """Fills chave_contato in batches, then drops duplicate contacts (keeping the oldest)."""
+    total = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT contato_id, telefone_direto, email_corporativo FROM contatos "
+                "WHERE chave_contato IS NULL AND contato_id > :last_id "
+                "ORDER BY contato_id LIMIT :limit"
+            ), {"last_id": last_id, "limit": BACKFILL_BATCH}).all()
+            if not rows:
+                break
+            updates = [{"id": contato_id, "key": contact_key(phone, email)} for contato_id, phone, email in rows]
+            conn.execute(text("UPDATE contatos SET chave_contato = :key WHERE contato_id = :id"), updates)
+            total += len(updates)
+            last_id = rows[-1][0]
+
+    with engine.begin() as conn:
+        removed = conn.execute(text(
+            "DELETE FROM contatos c USING contatos older "
+            "WHERE c.empresa_id = older.empresa_id AND c.chave_contato = older.chave_contato "
+            "AND c.contato_id > older.contato_id"
+        )).rowcount
+    print(f"✅ Backfilled {total} contacts ({removed} duplicates removed)")
+
+
+def create_contact_key_index():
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_contatos_empresa_chave "
+            "ON contatos (empresa_id, chave_contato)"
+        ))
+
+
+def create_job_table():
+    ScrapeJob.__table__.create(bind=engine, checkfirst=True)
+    # Tables created before job progress / leases were tracked
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE scrape_jobs ADD COLUMN IF NOT EXISTS progresso TEXT"))
+        conn.execute(text("ALTER TABLE scrape_jobs ADD COLUMN IF NOT EXISTS data_heartbeat TIMESTAMPTZ"))
+
+
+def migrate():
+    print("🔧 Migrating empresas.nome_normalizado...")
+    add_normalized_name()
+    backfill_normalized_name()
+    create_normalized_name_index()
+    print("🔧 Migrating contatos.chave_contato...")
+    add_contact_key()
+    backfill_contact_key()
+    create_contact_key_index()
+    print("🔧 Creating scrape_jobs...")
+    create_job_table()
+    print("✅ Migration complete!")
+
+
+if __name__ == "__main__":
+    migrate()
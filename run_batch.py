@@ -1,6 +1,8 @@
-import subprocess
-import time
+import asyncio
 from datetime import datetime
+from app.scraper import GoogleMapsScraper
+from app.services import export_csv, persist_leads
+from app.browser_pool import close_browser_pool
 
 # Estratégia de Coleta (Ondas)
 # Formato: (Query, Limit, Segment)
@@ -17,40 +19,42 @@ TARGETS = [
     ("Padaria Campinas", 30, "Energia Solar"),
 ]
 
-def run_scraper(query, limit, segment):
-    print(f"\n🚀 [ {datetime.now().strftime('%H:%M:%S')} ] Iniciando: {query}...")
-    
-    # Comando sem enriquecimento para velocidade (focamos em volume primeiro)
-    cmd = [
-        "python", "main.py",
-        "--query", query,
-        "--limit", str(limit),
-        "--segment", segment,
-        "--no-enrich" 
-    ]
-    
+async def run_wave():
+    # Sem enriquecimento para velocidade (focamos em volume primeiro).
+    # Todas as buscas rodam em abas do mesmo navegador; o espaçamento entre
+    # acessos ao Google fica a cargo do DomainPacer (sem sleeps fixos).
+    scraper = GoogleMapsScraper(headless=True)
     try:
-        # Executa e espera terminar
-        result = subprocess.run(cmd, check=False)
-        
-        if result.returncode == 0:
-            print(f"✅ Sucesso: {query}")
-        else:
-            print(f"⚠️ Erro (Código {result.returncode}): {query}")
-            
-    except Exception as e:
-        print(f"❌ Falha crítica: {e}")
+        results = await scraper.scrape_many([(query, limit) for query, limit, _ in TARGETS])
+        # Endereço, telefone e site de todos os alvos, em abas paralelas
+        all_leads = [lead for leads in results.values() for lead in leads]
+        await scraper.fetch_details(all_leads)
+        print(f"🛡️ {scraper.request_filter.summary()}")
+    finally:
+        await close_browser_pool()
 
-    # Pausa para "resfriar" e evitar bloqueio do Google
-    print("⏳ Aguardando 10s para evitar bloqueio...")
-    time.sleep(10)
+    for query, limit, segment in TARGETS:
+        leads = results.get(query, [])
+        print(f"\n📦 [ {datetime.now().strftime('%H:%M:%S')} ] {query}: {len(leads)} leads")
+        if not leads:
+            print(f"⚠️ Nenhum lead: {query}")
+            continue
+        try:
+            filename = export_csv(leads, query)
+            print(f"🎉 CSV salvo em {filename}")
+            result = persist_leads(leads, query, segment)
+            if result.get("status") == "success":
+                print(f"✅ Sucesso: {query}")
+            else:
+                print(f"⚠️ Erro: {query} ({result.get('message')})")
+        except Exception as e:
+            print(f"❌ Falha crítica: {e}")
 
 def main():
     print("🤖 --- INICIANDO AUTOMAÇÃO DE COLETA ---")
     print(f"🎯 Total de Alvos: {len(TARGETS)}\n")
     
-    for target in TARGETS:
-        run_scraper(*target)
+    asyncio.run(run_wave())
         
     print("\n🏁 --- COLETA FINALIZADA ---")
 